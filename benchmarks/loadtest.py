@@ -0,0 +1,424 @@
+#!/usr/bin/env python
+"""
+Load test of the /alert webhook and the alerts/hosts commands.
+
+The plugin is driven directly (without XMPP and HTTP servers) by concurrent worker threads. Messages are sent into
+a local fake XMPP sink and Zabbix API requests are answered by a local fake Zabbix JSON-RPC server with configurable
+latency and failure rate. Throughput, latency percentiles and error rates are printed as JSON. Zabbix API calls made
+by background jobs of the plugin (host index refreshes) are reported separately from the calls made by scenarios.
+
+Usage: python benchmarks/loadtest.py [--help]
+
+Requires Python >= 3.4, Ludolph and zabbix-api-erigones.
+"""
+from __future__ import print_function
+
+import argparse
+import inspect
+import io
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bottle import HTTPError, request  # noqa: E402
+from ludolph_zabbix.client import ZabbixClient  # noqa: E402
+from ludolph_zabbix.deadline import with_deadline  # noqa: E402
+from ludolph_zabbix.zapi import Zapi  # noqa: E402
+
+SCENARIOS = ('alert', 'alerts', 'hosts')
+ROOM = 'room@conference.example.com'
+USER = 'admin@example.com'
+
+
+def make_data(hosts, triggers, events_per_trigger=3):
+    """Return JSON-RPC results of read-only API methods used by the tested commands"""
+    now = int(time.time())
+    host_list = [{'hostid': str(10000 + i), 'name': 'web%05d.example.com' % i, 'available': '1', 'status': '0',
+                  'maintenance_status': '0', 'maintenance_type': '0', 'maintenanceid': '0',
+                  'inventory': {'os': 'FreeBSD' if i % 2 else 'Linux', 'location': 'rack%d' % (i % 40)}}
+                 for i in range(hosts)]
+    trigger_list = []
+    events = {}
+    eventid = 1
+
+    for i in range(triggers):
+        host = host_list[i % hosts]
+        triggerid = str(100000 + i)
+        trigger_events = []
+
+        for j in range(events_per_trigger):
+            trigger_events.append({'eventid': str(eventid), 'objectid': triggerid, 'clock': str(now - 600 * j - i),
+                                   'value': str((j + 1) % 2), 'acknowledged': '0', 'acknowledges': []})
+            eventid += 1
+
+        events[triggerid] = trigger_events
+        trigger_list.append({
+            'triggerid': triggerid, 'state': '0', 'error': '', 'url': '', 'priority': str(i % 6),
+            'description': 'Free disk space is less than 20%% on volume /srv/data%d' % i,
+            'comments': 'Check the application logs.', 'lastchange': str(now - i), 'value': '1',
+            'hosts': [{'hostid': host['hostid'], 'name': host['name'], 'maintenance_status': '0'}],
+            'items': [{'itemid': str(200000 + i), 'name': 'Free disk space on /srv/data%d' % i}],
+            'lastEvent': trigger_events[0],
+        })
+
+    return {'hosts': host_list, 'triggers': trigger_list, 'events': events,
+            'groups': [{'groupid': '2', 'name': 'Web servers'}]}
+
+
+class FakeZabbix(ThreadingMixIn, HTTPServer):
+    """
+    Fake Zabbix JSON-RPC server with configurable latency (seconds) and failure rate (0..1).
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, data, latency=0.0, failure_rate=0.0):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), FakeZabbixHandler)
+        self.data = data
+        self.latency = latency
+        self.failure_rate = failure_rate
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % self.server_address
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name='fake-zabbix')
+        thread.daemon = True
+        thread.start()
+
+    def result(self, method, params):
+        data = self.data
+
+        if method == 'user.login':
+            return 'fake-auth-token'
+        elif method == 'apiinfo.version':
+            return '3.4.0'
+        elif method == 'trigger.get':
+            return data['triggers']
+        elif method == 'event.get':
+            triggerids = params.get('triggerids', None) or ()
+            return [e for triggerid in triggerids for e in data['events'].get(str(triggerid), ())]
+        elif method == 'host.get':
+            return data['hosts']
+        elif method == 'hostgroup.get':
+            return data['groups']
+        elif method == 'maintenance.get':
+            return []
+
+        raise ValueError('Unsupported method "%s"' % method)
+
+
+class FakeZabbixHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+        method = body['method']
+
+        if server.latency:
+            time.sleep(server.latency)
+
+        if method != 'user.login' and random.random() < server.failure_rate:
+            self.send_error(500)
+            return
+
+        try:
+            res = {'jsonrpc': '2.0', 'result': server.result(method, body.get('params', {})), 'id': body['id']}
+        except ValueError as exc:
+            res = {'jsonrpc': '2.0', 'error': {'code': -32602, 'message': 'Invalid params.', 'data': str(exc)},
+                   'id': body['id']}
+
+        raw = json.dumps(res).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+
+class FakeSessionEvent(object):
+    @staticmethod
+    def is_set():
+        return True
+
+
+class FakeClient(object):
+    session_started_event = FakeSessionEvent()
+
+
+class FakeXMPP(object):
+    """
+    Fake LudolphBot which only counts sent messages.
+    """
+    room = ROOM
+    client = FakeClient()
+
+    def __init__(self):
+        self.sent = 0
+        self.lock = threading.Lock()
+
+    # noinspection PyUnusedLocal
+    def get_jid(self, msg, bare=True):
+        return USER
+
+    # noinspection PyUnusedLocal
+    def msg_send(self, mto, mbody, **kwargs):
+        with self.lock:
+            self.sent += 1
+
+        return True
+
+    def msg_broadcast(self, mbody, **kwargs):
+        return self.msg_send(None, mbody, **kwargs)
+
+
+class ApiCalls(object):
+    """
+    Counter of Zabbix API calls (and failed calls) made by the plugin. Calls made by host index refreshes running in
+    the background are counted separately from calls made by the scenarios.
+    """
+    KINDS = ('scenario', 'background')
+
+    def __init__(self):
+        self.calls = dict((kind, Counter()) for kind in self.KINDS)
+        self.failures = dict((kind, Counter()) for kind in self.KINDS)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def install(self, zapi):
+        """Count API calls of the plugin; must be called before zapi.__post_init__()"""
+        refresh_host_index = zapi._refresh_host_index
+        call = ZabbixClient.call
+
+        def refresh_host_index_wrapper(server):
+            self.local.background = True
+
+            try:
+                return refresh_host_index(server)
+            finally:
+                self.local.background = False
+
+        def call_wrapper(client, method, *args, **kwargs):
+            kind = 'background' if getattr(self.local, 'background', False) else 'scenario'
+
+            with self.lock:
+                self.calls[kind][method] += 1
+
+            try:
+                return call(client, method, *args, **kwargs)
+            except Exception:
+                with self.lock:
+                    self.failures[kind][method] += 1
+                raise
+
+        zapi._refresh_host_index = refresh_host_index_wrapper
+        ZabbixClient.call = call_wrapper
+
+    def snapshot(self):
+        """Return dict of counters of calls and failed calls per kind"""
+        with self.lock:
+            res = dict(('%s calls' % kind, Counter(self.calls[kind])) for kind in self.KINDS)
+            res.update(('%s failures' % kind, Counter(self.failures[kind])) for kind in self.KINDS)
+
+        return res
+
+
+def alert_environ(jid, msg):
+    body = urlencode({'jid': jid, 'msg': msg}).encode('utf-8')
+
+    return {
+        'REQUEST_METHOD': 'POST',
+        'PATH_INFO': '/alert',
+        'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body),
+    }
+
+
+def make_task(zapi, scenario):
+    """Return function performing one operation of a scenario"""
+    if scenario == 'alert':
+        def task():
+            request.bind(alert_environ(random.choice((ROOM, USER)), 'PROBLEM: Free disk space is less than 20%'))
+            return zapi.alert()
+    else:
+        # Command with the deadline, but without the permission checks and reply
+        fun = with_deadline(inspect.unwrap(getattr(Zapi, scenario)))
+
+        def task():
+            return fun(zapi, None)
+
+    return task
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return None
+
+    return values[min(int(len(values) * pct / 100.0), len(values) - 1)]
+
+
+def run_scenario(zapi, scenario, concurrency, duration):
+    """Run one scenario in concurrent threads and return its statistics"""
+    task = make_task(zapi, scenario)
+    latencies = []
+    errors = Counter()
+    lock = threading.Lock()
+    deadline = time.time() + duration
+
+    def worker():
+        local_latencies = []
+        local_errors = Counter()
+
+        while time.time() < deadline:
+            start = time.time()
+
+            try:
+                task()
+            except HTTPError as exc:
+                local_errors['HTTP %s' % exc.status_code] += 1
+            except Exception as exc:
+                local_errors[exc.__class__.__name__] += 1
+
+            local_latencies.append(time.time() - start)
+
+        with lock:
+            latencies.extend(local_latencies)
+            errors.update(local_errors)
+
+    start = time.time()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    elapsed = time.time() - start
+    latencies.sort()
+    total = len(latencies)
+    failed = sum(errors.values())
+
+    return {
+        'requests': total,
+        'errors': dict(errors),
+        'error rate': round(float(failed) / total, 4) if total else None,
+        'throughput rps': round(total / elapsed, 1),
+        'latency ms': dict((name, round(value * 1000, 2) if value is not None else None) for name, value in (
+            ('mean', sum(latencies) / total if total else None),
+            ('p50', percentile(latencies, 50)),
+            ('p90', percentile(latencies, 90)),
+            ('p99', percentile(latencies, 99)),
+            ('max', latencies[-1] if latencies else None),
+        )),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test of the ludolph-zabbix webhook and commands')
+    parser.add_argument('-s', '--scenario', action='append', choices=SCENARIOS,
+                        help='scenario to run (can be repeated; default: all)')
+    parser.add_argument('-c', '--concurrency', type=int, default=8, help='number of concurrent clients')
+    parser.add_argument('-d', '--duration', type=float, default=10, help='seconds per scenario')
+    parser.add_argument('-l', '--latency', type=float, default=0.02, help='fake Zabbix API latency in seconds')
+    parser.add_argument('-f', '--failure-rate', type=float, default=0, help='fraction of failed Zabbix API calls')
+    parser.add_argument('--servers', type=int, default=1, help='number of fake Zabbix servers')
+    parser.add_argument('--hosts', type=int, default=500, help='number of hosts per Zabbix server')
+    parser.add_argument('--triggers', type=int, default=200, help='number of problem triggers per Zabbix server')
+    parser.add_argument('--cache-ttl', type=float, default=Zapi.CACHE_TTL, help='plugin cache_ttl option')
+    parser.add_argument('--command-timeout', type=float, default=Zapi.COMMAND_TIMEOUT,
+                        help='plugin command_timeout option')
+    parser.add_argument('--host-index-interval', type=int, default=0,
+                        help='plugin host_index_interval option (default: 0 = host index disabled)')
+    parser.add_argument('--spool', action='store_true', help='queue alerts in a temporary alert spool')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    data = make_data(args.hosts, args.triggers)
+    zabbix_servers = []
+    config = {'username': 'ludolph', 'password': 'secret', 'cache_ttl': args.cache_ttl,
+              'command_timeout': args.command_timeout, 'host_index_interval': args.host_index_interval,
+              'loglevel': 'CRITICAL'}
+
+    for i in range(args.servers):
+        server = FakeZabbix(data, latency=args.latency, failure_rate=args.failure_rate)
+        server.start()
+        zabbix_servers.append(server)
+
+    if args.servers > 1:
+        names = ['zbx%d' % i for i in range(args.servers)]
+        config['servers'] = ','.join(names)
+        config.update(('%s.server' % name, server.url) for name, server in zip(names, zabbix_servers))
+    else:
+        config['server'] = zabbix_servers[0].url
+
+    spool_dir = None
+
+    if args.spool:
+        spool_dir = tempfile.mkdtemp(prefix='ludolph-spool-')
+        config['spool'] = os.path.join(spool_dir, 'alerts')
+
+    xmpp = FakeXMPP()
+    zapi = Zapi(xmpp, config)
+    api_calls = ApiCalls()
+    api_calls.install(zapi)
+    zapi.__post_init__()
+
+    for name in zapi._zapis:  # Zabbix API versions are cached in a long-running bot
+        zapi._prefetch_zapi_version(name)
+    report = {'config': dict(vars(args), scenario=args.scenario or SCENARIOS)}
+
+    try:
+        for scenario in args.scenario or SCENARIOS:
+            api_calls_before = api_calls.snapshot()
+            sent_before = xmpp.sent
+            stats = run_scenario(zapi, scenario, args.concurrency, args.duration)
+            # Failures of one Zabbix server in multi-server mode are reported in the command output, not as errors
+            for name, counter in api_calls.snapshot().items():
+                stats['zabbix api %s' % name] = dict(counter - api_calls_before[name])
+
+            if scenario == 'alert':
+                if zapi._spool:  # Wait until all queued alerts are delivered
+                    start = time.time()
+
+                    while zapi._spool.pending:
+                        time.sleep(0.01)
+
+                    stats['spool drain seconds'] = round(time.time() - start, 3)
+
+                stats['messages sent'] = xmpp.sent - sent_before
+
+            report[scenario] = stats
+    finally:
+        zapi.__destroy__()
+
+        for server in zabbix_servers:
+            server.shutdown()
+
+        if spool_dir:
+            shutil.rmtree(spool_dir)
+
+    print(json.dumps(report, indent=4, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
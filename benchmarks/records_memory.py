@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""
+Memory benchmark: decoding of large trigger.get/event.get results into nested dicts vs. incremental decoding into
+compact records (ludolph_zabbix.records).
+
+Usage: python benchmarks/records_memory.py [number of triggers]
+
+Requires Python >= 3.4 (tracemalloc) and zabbix-api-erigones.
+"""
+from __future__ import print_function
+
+import gc
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ludolph_zabbix.client import decode_response  # noqa: E402
+from ludolph_zabbix.records import Event, Trigger  # noqa: E402
+
+
+def make_event(eventid, triggerid, clock, value):
+    return {
+        'eventid': str(eventid), 'source': '0', 'object': '0', 'objectid': str(triggerid), 'clock': str(clock),
+        'value': str(value), 'acknowledged': '1', 'ns': '123456789', 'r_eventid': '0', 'c_eventid': '0',
+        'correlationid': '0', 'userid': '0', 'name': 'Free disk space is less than 20% on volume /',
+        'severity': '3', 'suppressed': '0',
+        'acknowledges': [{'acknowledgeid': str(eventid), 'userid': '3', 'eventid': str(eventid), 'clock': str(clock),
+                          'message': 'ludolph@example.com: looking into it', 'action': '0', 'old_severity': '0',
+                          'new_severity': '0', 'alias': 'ludolph', 'name': 'Ludolph', 'surname': 'Bot'}],
+    }
+
+
+def make_responses(count):
+    """Return raw trigger.get and event.get JSON-RPC responses"""
+    now = int(time.time())
+    triggers = []
+    events = []
+
+    for i in range(count):
+        triggerid = 100000 + i
+        trigger_events = [make_event(triggerid * 10 + j, triggerid, now - j * 600, (j + 1) % 2) for j in range(3)]
+        events.extend(trigger_events)
+        triggers.append({
+            'triggerid': str(triggerid), 'state': '0', 'error': '', 'url': '', 'priority': str(i % 6),
+            'description': 'Free disk space is less than 20%% on volume /srv/data%d on web%05d.example.com' % (i, i),
+            'comments': 'The disk is filling up. Check the application logs and rotate them if needed.',
+            'lastchange': str(now - i), 'expression': '{%d}<20' % (i + 500000), 'type': '0', 'value': '1',
+            'hosts': [{'hostid': str(10000 + i % 2000), 'name': 'web%05d.example.com' % (i % 2000),
+                       'maintenance_status': '0', 'maintenance_type': '0', 'maintenanceid': '0'}],
+            'items': [{'itemid': str(200000 + i), 'name': 'Free disk space on /srv/data%d (percentage)' % i},
+                      {'itemid': str(300000 + i), 'name': 'Total disk space on /srv/data%d' % i}],
+            'lastEvent': dict(trigger_events[0]),
+        })
+
+    def dump(result):
+        return json.dumps({'jsonrpc': '2.0', 'result': result, 'id': 1}).encode('utf-8')
+
+    return dump(triggers), dump(events)
+
+
+def measure(fun):
+    """Return (peak memory, retained memory, seconds); the time is measured without tracemalloc overhead"""
+    gc.collect()
+    start = time.time()
+    fun()
+    elapsed = time.time() - start
+    gc.collect()
+    tracemalloc.start()
+    result = fun()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    return peak, current, elapsed
+
+
+def main(count=10000):
+    raw_triggers, raw_events = make_responses(count)
+    report = {'triggers': count, 'trigger.get bytes': len(raw_triggers), 'event.get bytes': len(raw_events)}
+
+    for name, raw, record in (('trigger.get', raw_triggers, Trigger), ('event.get', raw_events, Event)):
+        # The dicts mode decodes the response the same way as ZabbixAPI.do_request()
+        for mode, fun in (('dicts', lambda: json.loads(io.BytesIO(raw).read().decode('utf-8'))['result']),
+                          ('records', lambda: decode_response(io.BytesIO(raw), record=record))):
+            peak, retained, elapsed = measure(fun)
+            report['%s %s' % (name, mode)] = {
+                'peak MiB': round(peak / 1048576.0, 2),
+                'retained MiB': round(retained / 1048576.0, 2),
+                'seconds': round(elapsed, 3),
+            }
+
+    print(json.dumps(report, indent=4, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
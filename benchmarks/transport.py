@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""
+Transport benchmark: bytes on the wire and decode time per API call of large trigger.get (alerts) and event.get
+results for every content encoding (identity, gzip, deflate) and every installed JSON codec (ludolph_zabbix.jsoncodec).
+The codec affects only the dicts mode; the records mode always decodes incrementally by simplejson or json.
+
+Usage: python benchmarks/transport.py [number of triggers] [repeats]
+
+Requires Python 3 and zabbix-api-erigones.
+"""
+from __future__ import print_function
+
+import gzip
+import io
+import json
+import os
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ludolph_zabbix.client import DecompressingReader, decode_response  # noqa: E402
+from ludolph_zabbix.jsoncodec import available_codecs, get_codec  # noqa: E402
+from ludolph_zabbix.records import Event, Trigger  # noqa: E402
+
+from records_memory import make_responses  # noqa: E402
+
+ENCODINGS = ('identity', 'gzip', 'deflate')
+
+
+def encode(body, encoding):
+    """Return response body as sent by a web server with the content encoding (compression level 6)"""
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=6)
+    elif encoding == 'deflate':
+        return zlib.compress(body, 6)
+    return body
+
+
+def decode(body, encoding, record, codec):
+    fp = io.BytesIO(body)
+
+    if encoding != 'identity':
+        fp = DecompressingReader(fp, encoding)
+
+    return decode_response(fp, record=record, codec=codec)
+
+
+def best_time(fun, repeats):
+    """Return the shortest run time in seconds"""
+    res = []
+
+    for _ in range(repeats):
+        start = time.time()
+        fun()
+        res.append(time.time() - start)
+
+    return min(res)
+
+
+def main(count=10000, repeats=3):
+    raw_triggers, raw_events = make_responses(count)
+    report = {'triggers': count, 'codecs': available_codecs()}
+
+    for name, raw, record in (('trigger.get', raw_triggers, Trigger), ('event.get', raw_events, Event)):
+        report[name] = method_report = {}
+
+        for encoding in ENCODINGS:
+            body = encode(raw, encoding)
+            method_report[encoding] = enc_report = {'wire bytes': len(body), 'ratio': round(len(raw) / len(body), 2)}
+
+            for codec_name in available_codecs():
+                codec = get_codec(codec_name)
+                elapsed = best_time(lambda: decode(body, encoding, None, codec), repeats)
+                enc_report['%s dicts ms' % codec_name] = round(elapsed * 1000, 1)
+
+            elapsed = best_time(lambda: decode(body, encoding, record, None), repeats)
+            enc_report['records ms'] = round(elapsed * 1000, 1)
+
+    print(json.dumps(report, indent=4, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,289 @@
+"""
+This file is part of Ludolph: Zabbix API plugin
+Copyright (C) 2015-2017 Erigones, s. r. o.
+
+See the LICENSE file for copying permission.
+"""
+import codecs
+import re
+import zlib
+from logging import DEBUG, INFO, WARNING, ERROR
+from time import time
+
+try:
+    import urllib2
+except ImportError:
+    # noinspection PyUnresolvedReferences,PyPep8Naming
+    import urllib.request as urllib2  # python3
+
+from zabbix_api import ZabbixAPI, ZabbixAPIException, ZabbixAPIError
+
+from ludolph_zabbix.jsoncodec import get_codec
+
+__all__ = ('ZabbixClient', 'DecompressingReader', 'decode_response')
+
+CHUNK_SIZE = 65536
+RE_RESULT_START = re.compile(r'\s*\{\s*"jsonrpc"\s*:\s*"2\.0"\s*,\s*"result"\s*:\s*\[')
+RE_WHITESPACE = re.compile(r'\s*')
+CONTENT_ENCODINGS = ('gzip', 'deflate')
+
+
+def _parse_response(jobj, record=None):
+    """Check fully decoded JSON-RPC response and return result (projected into records)"""
+    if 'error' in jobj:  # zabbix API error
+        error = jobj['error']
+
+        if isinstance(error, dict):
+            raise ZabbixAPIError(**error)
+
+    try:
+        result = jobj['result']
+    except KeyError:
+        raise ZabbixAPIException('Missing result in API response')
+
+    if record is not None and isinstance(result, list):
+        memo = {}
+        return [record.from_api(i, memo) for i in result]
+
+    return result
+
+
+class DecompressingReader(object):
+    """
+    File-like wrapper decompressing a gzip or deflate encoded HTTP response body while it is being read.
+    """
+    def __init__(self, fp, encoding):
+        self.fp = fp
+        self.encoding = encoding
+        self._decompressor = self._get_decompressor(encoding)
+        self._started = False
+        self._eof = False
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, self.encoding)
+
+    @staticmethod
+    def _get_decompressor(encoding, raw=False):
+        if encoding == 'gzip':
+            return zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            # Some servers send raw deflate data without the zlib header
+            return zlib.decompressobj(-zlib.MAX_WBITS if raw else zlib.MAX_WBITS)
+        else:
+            raise ValueError('Unsupported content encoding: %s' % encoding)
+
+    def _decompress(self, data, size):
+        try:
+            return self._decompressor.decompress(data, size)
+        except zlib.error:
+            if self._started or self.encoding != 'deflate':
+                raise
+            self._decompressor = self._get_decompressor(self.encoding, raw=True)
+            return self._decompressor.decompress(data, size)
+
+    def read(self, size=CHUNK_SIZE):
+        """Read and return up to size bytes of decompressed data; empty bytes are returned at the end of data"""
+        if size is None or size < 0:
+            size = CHUNK_SIZE
+
+        while not self._eof:
+            tail = self._decompressor.unconsumed_tail
+
+            if tail:
+                data = tail
+            else:
+                data = self.fp.read(size)
+
+                if not data:
+                    self._eof = True
+                    return self._decompressor.flush()
+
+            res = self._decompress(data, size)
+            self._started = True
+
+            if res:
+                return res
+
+        return b''
+
+    def close(self):
+        self.fp.close()
+
+
+def decode_response(fp, record=None, chunk_size=CHUNK_SIZE, codec=None):
+    """
+    Decode JSON-RPC response from file-like object fp and return the result. If record is set (a class with the
+    from_api() method), the result array is decoded incrementally and every element is immediately projected into
+    a record, so only one decoded element is kept in memory at a time. The codec (ludolph_zabbix.jsoncodec) defaults
+    to the fastest installed JSON library; its loads() is used only if the response is decoded as a whole, the
+    incremental decoding always uses raw_decode() of simplejson or json.
+    """
+    if codec is None:
+        codec = get_codec()
+
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    chunks = []  # Raw data; whole responses are decoded from bytes by the codec
+    buf = ''
+    match = None
+    eof = False
+
+    while not eof and record is not None:  # Read until we can check the beginning of the response
+        data = fp.read(chunk_size)
+        eof = not data
+        chunks.append(data)
+        buf += decoder.decode(data, final=eof)
+        match = RE_RESULT_START.match(buf)
+
+        if match or len(buf) >= 64:
+            break
+
+    if record is None or not match:  # Error, unexpected envelope or no projection -> decode everything
+        while not eof:
+            data = fp.read(chunk_size)
+            eof = not data
+            chunks.append(data)
+
+        data = b''.join(chunks)
+
+        if not data:
+            raise ZabbixAPIException('Received zero answer')
+
+        try:
+            jobj = codec.loads(data)
+        except ValueError as e:
+            raise ZabbixAPIException('Unable to decode response: %s' % e)
+
+        return _parse_response(jobj, record=record)
+
+    res = []
+    memo = {}
+    pos = match.end()
+    expect_value = True  # Right after "[" or ","
+
+    while True:
+        pos = RE_WHITESPACE.match(buf, pos).end()
+
+        if pos < len(buf):
+            char = buf[pos]
+
+            if char == ']':
+                return res  # The rest of the envelope ("id") is not needed
+            elif char == ',' and not expect_value:
+                pos += 1
+                expect_value = True
+                continue
+            elif expect_value:
+                try:
+                    obj, end = codec.raw_decode(buf, pos)
+                except ValueError:
+                    if eof:
+                        raise ZabbixAPIException('Unable to decode response: invalid result element')
+                else:
+                    if end < len(buf) or eof:  # A number at the end of buffer may continue in next chunk
+                        res.append(record.from_api(obj, memo))
+                        pos = end
+                        expect_value = False
+                        continue
+            else:
+                raise ZabbixAPIException('Unable to decode response: unexpected character %r' % char)
+        elif eof:
+            raise ZabbixAPIException('Unable to decode response: unexpected end of data')
+
+        # Need more data -> drop already decoded part of the buffer
+        data = fp.read(chunk_size)
+        eof = not data
+        buf = buf[pos:] + decoder.decode(data, final=eof)
+        pos = 0
+
+
+class ZabbixClient(ZabbixAPI):
+    """
+    ZabbixAPI with support for incremental decoding of large API results into compact records, compressed HTTP
+    responses (gzip, deflate) and a pluggable JSON codec.
+    """
+    AUTH_FREE_METHODS = frozenset(('apiinfo.version',))  # Methods which must be called without authentication
+
+    def __init__(self, *args, **kwargs):
+        self.compression = kwargs.pop('compression', True)
+        json_codec = kwargs.pop('json_codec', 'auto')
+        super(ZabbixClient, self).__init__(*args, **kwargs)
+
+        try:
+            self.codec = get_codec(json_codec)
+        except ValueError as exc:
+            self.codec = get_codec()
+            self.log(WARNING, '%s - using the "%s" codec', exc, self.codec.name)
+
+    def init(self):
+        """Prepare the HTTP handler, URL, and HTTP headers for all subsequent requests"""
+        super(ZabbixClient, self).init()
+
+        if self.compression:
+            self._http_headers['Accept-Encoding'] = ', '.join(CONTENT_ENCODINGS)
+
+    def do_request(self, json_obj, record=None, timeout=None):
+        """Perform one HTTP request to Zabbix API (timeout defaults to self.timeout)"""
+        self.debug('Request: url="%s" headers=%s', self._api_url, self._http_headers)
+        self.debug('Request: body=%s', json_obj)
+        self.r_query.append(json_obj)
+
+        request = urllib2.Request(url=self._api_url, data=json_obj.encode('utf-8'), headers=self._http_headers)
+        opener = urllib2.build_opener(self._http_handler)
+
+        try:
+            response = opener.open(request, timeout=self.timeout if timeout is None else timeout)
+        except Exception as e:
+            raise ZabbixAPIException('HTTP connection problem: %s' % e)
+
+        encoding = (response.info().get('Content-Encoding') or '').strip().lower()
+        self.debug('Response: code=%s encoding=%s', response.code, encoding or 'identity')
+
+        # NOTE: Getting a 412 response code means the headers are not in the list of allowed headers.
+        if response.code != 200:
+            raise ZabbixAPIException('HTTP error %s' % response.code)
+
+        if encoding in CONTENT_ENCODINGS:
+            fp = DecompressingReader(response, encoding)
+        else:
+            fp = response
+
+        try:
+            result = decode_response(fp, record=record, codec=self.codec)
+        except ZabbixAPIError:
+            raise
+        except ZabbixAPIException:
+            self.log(ERROR, 'Unable to decode response from %s', self._api_url)
+            raise
+        except Exception as e:  # Connection closed, timeout, corrupted compressed data, ...
+            raise ZabbixAPIException('HTTP connection problem: %s' % e)
+        finally:
+            response.close()
+            self.id += 1
+
+        self.debug('Response: body=%s', result)
+
+        return result
+
+    def call(self, method, params=None, record=None, timeout=None):
+        """Check authentication and perform actual API request and relogin if needed. The result is projected into
+        records if the record class is specified"""
+        start_time = time()
+        auth = method not in self.AUTH_FREE_METHODS
+
+        if auth:
+            self.check_auth()
+
+        self.log(INFO, '[%s-%05d] Calling Zabbix API method "%s"', start_time, self.id, method)
+        self.log(DEBUG, '\twith parameters: %s', params)
+
+        try:
+            return self.do_request(self.json_obj(method, params=params, auth=auth), record=record, timeout=timeout)
+        except ZabbixAPIError as ex:
+            if self.relogin_interval and any(i in ex.error['data'] for i in self.LOGIN_ERRORS):
+                self.log(WARNING, 'Zabbix API not logged in (%s). Performing Zabbix API relogin', ex)
+                self.relogin()  # Will raise exception in case of login error
+                return self.do_request(self.json_obj(method, params=params), record=record, timeout=timeout)
+            raise  # Re-raise the exception
+        finally:
+            self.log(INFO, '[%s-%05d] Zabbix API method "%s" finished in %g seconds',
+                     start_time, self.id, method, (time() - start_time))
@@ -0,0 +1,82 @@
+"""
+This file is part of Ludolph: Zabbix API plugin
+Copyright (C) 2015-2017 Erigones, s. r. o.
+
+See the LICENSE file for copying permission.
+"""
+from contextlib import contextmanager
+from functools import wraps
+from threading import local
+from time import time
+
+from ludolph.command import CommandError
+
+__all__ = ('Deadline', 'DeadlineExceeded', 'activate', 'with_deadline')
+
+_local = local()
+
+
+class DeadlineExceeded(CommandError):
+    """
+    The time budget of a command has run out.
+    """
+    pass
+
+
+class Deadline(object):
+    """
+    Time budget of one command shared by all (also concurrent) Zabbix API calls made on behalf of the command.
+    """
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires = time() + seconds
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, self.seconds)
+
+    def remaining(self):
+        """Return number of seconds left"""
+        return max(self.expires - time(), 0)
+
+    @property
+    def expired(self):
+        return time() >= self.expires
+
+    def error(self):
+        """Return DeadlineExceeded exception"""
+        return DeadlineExceeded('Command deadline exceeded (%g seconds)' % self.seconds)
+
+    def check(self):
+        """Raise DeadlineExceeded if the time budget has run out"""
+        if self.expired:
+            raise self.error()
+
+    @staticmethod
+    def current():
+        """Return deadline active in current thread or None"""
+        return getattr(_local, 'deadline', None)
+
+
+@contextmanager
+def activate(deadline):
+    """Make the deadline (or no deadline if None) active in current thread"""
+    previous = Deadline.current()
+    _local.deadline = deadline
+
+    try:
+        yield deadline
+    finally:
+        _local.deadline = previous
+
+
+def with_deadline(fun):
+    """
+    Decorator for running plugin commands with a deadline of obj.command_timeout seconds (0 = no deadline).
+    It must be applied above the @command decorator, which inspects the arguments of the original method.
+    """
+    @wraps(fun)
+    def wrap(obj, *args, **kwargs):
+        with activate(Deadline(obj.command_timeout) if obj.command_timeout else None):
+            return fun(obj, *args, **kwargs)
+
+    return wrap
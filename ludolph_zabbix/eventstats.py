@@ -0,0 +1,60 @@
+"""
+This file is part of Ludolph: Zabbix API plugin
+Copyright (C) 2015-2017 Erigones, s. r. o.
+
+See the LICENSE file for copying permission.
+"""
+import heapq
+
+__all__ = ('ProblemStats',)
+
+
+class ProblemStats(object):
+    """
+    Running number of problems and total problem duration per trigger. Trigger events (records with objectid, clock
+    and value attributes) are added in chunks ordered by event ID, so memory usage depends only on the number of
+    distinct triggers, not on the number of events.
+    """
+    def __init__(self, since, until):
+        self.since = int(since)
+        self.until = int(until)
+        self.events = 0
+        self._triggers = {}  # triggerid -> [number of problems, problem duration, problem start or None]
+
+    def __repr__(self):
+        return '%s(%s, %s)' % (self.__class__.__name__, self.since, self.until)
+
+    def __len__(self):
+        return len(self._triggers)
+
+    def add_events(self, events):
+        """Add a chunk of trigger events"""
+        triggers = self._triggers
+
+        for e in events:
+            state = triggers.get(e.objectid, None)
+
+            if state is None:
+                # The first event is OK -> the problem started before the time period
+                state = triggers[e.objectid] = [0, 0, self.since if e.value == 0 else None]
+
+            if e.value == 1:
+                state[0] += 1
+
+                if state[2] is None:
+                    state[2] = e.clock
+            elif e.value == 0 and state[2] is not None:
+                state[1] += max(e.clock - state[2], 0)
+                state[2] = None
+
+        self.events += len(events)
+
+    def totals(self):
+        """Return dict of triggerid -> (number of problems, problem duration); open problems last until now"""
+        return dict((triggerid, (problems, duration + (self.until - start if start is not None else 0)))
+                    for triggerid, (problems, duration, start) in self._triggers.items())
+
+    @staticmethod
+    def top(totals, limit):
+        """Return list of (key, (number of problems, problem duration)) tuples with the highest values"""
+        return heapq.nlargest(limit, totals.items(), key=lambda x: x[1])
@@ -0,0 +1,170 @@
+"""
+This file is part of Ludolph: Zabbix API plugin
+Copyright (C) 2015-2017 Erigones, s. r. o.
+
+See the LICENSE file for copying permission.
+"""
+import re
+from fnmatch import fnmatchcase
+from threading import Lock
+from time import time
+
+__all__ = ('HostIndex',)
+
+RE_TOKEN_SEPARATOR = re.compile(r'[\s,;]+')
+WILDCARD_CHARS = frozenset('*?[')
+
+
+class HostIndex(object):
+    """
+    Local inverted index over host names, interfaces (ip, dns) and inventory fields of one Zabbix server.
+
+    The index maps every field to its lower-cased values and their words, and every value/word to a set of host IDs.
+    Hosts are stored as Host records (ludolph_zabbix.records) and are added or replaced by update().
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._hosts = {}  # hostid -> Host
+        self._fetched = {}  # hostid -> time when the host was fetched from zabbix API
+        self._index = {}  # field -> {term -> set(hostids)}
+        self._cursor = 0  # Position of the next round-robin refresh
+        self.updated = None  # Time of the last (partial) update; None -> the index is not ready yet
+
+    def __repr__(self):
+        return '%s(%d hosts)' % (self.__class__.__name__, len(self))
+
+    def __len__(self):
+        return len(self._hosts)
+
+    @staticmethod
+    def _terms(host):
+        """Return set of (field, term) tuples for one host"""
+        fields = [('name', host.name)]
+        fields.extend(('ip', iface.ip) for iface in host.interfaces)
+        fields.extend(('dns', iface.dns) for iface in host.interfaces)
+        fields.extend(host.inventory)
+        terms = set()
+
+        for field, value in fields:
+            value = value.strip().lower()
+
+            if value:
+                terms.add((field, value))
+                terms.update((field, word) for word in RE_TOKEN_SEPARATOR.split(value) if word)
+
+        return terms
+
+    def _remove(self, hostid):
+        host = self._hosts.pop(hostid, None)
+        self._fetched.pop(hostid, None)
+
+        if host is None:
+            return
+
+        for field, term in self._terms(host):
+            terms = self._index[field]
+            hostids = terms[term]
+            hostids.discard(hostid)
+
+            if not hostids:
+                del terms[term]
+
+                if not terms:
+                    del self._index[field]
+
+    def update(self, hosts):
+        """Add or replace hosts"""
+        now = time()
+
+        with self._lock:
+            for host in hosts:
+                self._remove(host.hostid)
+                self._hosts[host.hostid] = host
+                self._fetched[host.hostid] = now
+
+                for field, term in self._terms(host):
+                    self._index.setdefault(field, {}).setdefault(term, set()).add(host.hostid)
+
+            self.updated = now
+
+    def remove(self, hostids):
+        """Remove hosts"""
+        with self._lock:
+            for hostid in hostids:
+                self._remove(hostid)
+
+            self.updated = time()
+
+    def fetched(self, hostids):
+        """Return the time when the least recently fetched host of hostids was fetched (None if no host is known)"""
+        with self._lock:
+            times = [self._fetched[i] for i in hostids if i in self._fetched]
+
+        return min(times) if times else None
+
+    def hostids(self):
+        """Return set of indexed host IDs"""
+        with self._lock:
+            return set(self._hosts)
+
+    def next_slice(self, count):
+        """Return list of host IDs which should be refreshed next (round-robin over all hosts)"""
+        with self._lock:
+            hostids = sorted(self._hosts)
+
+            if not hostids:
+                return []
+
+            start = self._cursor % len(hostids)
+            res = hostids[start:start + count]
+            res.extend(hostids[:max(count - len(res), 0)])
+            self._cursor = start + count
+
+            return list(set(res))
+
+    @staticmethod
+    def parse_query(query):
+        """Parse search string with field:pattern terms into list of (field, pattern) tuples. Plain words are
+        searched in host names"""
+        res = []
+
+        for word in query.split():
+            field, sep, pattern = word.partition(':')
+
+            if not sep:
+                field, pattern = 'name', '*%s*' % word
+
+            if not field or not pattern:
+                raise ValueError(word)
+
+            res.append((field.lower(), pattern.lower()))
+
+        return res
+
+    def _match(self, field, pattern):
+        terms = self._index.get(field, {})
+
+        if WILDCARD_CHARS.isdisjoint(pattern):
+            return terms.get(pattern, set())
+
+        res = set()
+
+        for term, hostids in terms.items():
+            if fnmatchcase(term, pattern):
+                res.update(hostids)
+
+        return res
+
+    def search(self, query):
+        """Return list of Host records matching all (field, pattern) tuples sorted by host name"""
+        with self._lock:
+            hostids = None
+
+            for field, pattern in query:
+                matched = self._match(field, pattern)
+                hostids = matched if hostids is None else hostids & matched
+
+                if not hostids:
+                    return []
+
+            return sorted((self._hosts[i] for i in hostids or ()), key=lambda h: h.name)
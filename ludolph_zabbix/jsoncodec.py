@@ -0,0 +1,87 @@
+"""
+This file is part of Ludolph: Zabbix API plugin
+Copyright (C) 2015-2017 Erigones, s. r. o.
+
+See the LICENSE file for copying permission.
+
+JSON decoders used for Zabbix API responses. Whole documents are decoded by the fastest installed library
+(orjson, ujson, simplejson or the standard json module). The incremental decoding of large results (see
+ludolph_zabbix.client.decode_response) needs raw_decode(), which is provided by simplejson (if installed) or json.
+"""
+import json
+
+try:
+    # noinspection PyPackageRequirements
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    # noinspection PyPackageRequirements
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    # noinspection PyPackageRequirements
+    import simplejson
+except ImportError:
+    simplejson = None
+
+__all__ = ('JSONCodec', 'get_codec', 'available_codecs')
+
+
+class JSONCodec(object):
+    """
+    Named pair of JSON decoding functions: loads(str) and raw_decode(str, pos) -> (obj, end).
+    """
+    __slots__ = ('name', 'loads', 'raw_decode')
+
+    def __init__(self, name, loads, raw_decode):
+        self.name = name
+        self.loads = loads
+        self.raw_decode = raw_decode
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, self.name)
+
+
+def _make_codecs():
+    if simplejson is None:
+        raw_decode = json.JSONDecoder().raw_decode
+    else:
+        raw_decode = simplejson.JSONDecoder().raw_decode
+
+    codecs = [('json', JSONCodec('json', json.loads, json.JSONDecoder().raw_decode))]
+
+    if simplejson is not None:
+        codecs.append(('simplejson', JSONCodec('simplejson', simplejson.loads, raw_decode)))
+
+    if ujson is not None:
+        codecs.append(('ujson', JSONCodec('ujson', ujson.loads, raw_decode)))
+
+    if orjson is not None:
+        codecs.append(('orjson', JSONCodec('orjson', orjson.loads, raw_decode)))
+
+    return codecs
+
+
+_CODECS = _make_codecs()  # Ordered from the slowest to the fastest
+
+
+def available_codecs():
+    """Return list of names of installed JSON codecs"""
+    return [name for name, codec in _CODECS]
+
+
+def get_codec(name='auto'):
+    """Return JSON codec by name or the fastest installed codec if name is "auto". ValueError is raised if the
+    codec is not installed"""
+    if name == 'auto':
+        return _CODECS[-1][1]
+
+    for codec_name, codec in _CODECS:
+        if codec_name == name:
+            return codec
+
+    raise ValueError('JSON codec "%s" is not available (installed: %s)' % (name, ', '.join(available_codecs())))
@@ -0,0 +1,104 @@
+"""
+This file is part of Ludolph: Zabbix API plugin
+Copyright (C) 2015-2017 Erigones, s. r. o.
+
+See the LICENSE file for copying permission.
+
+Compact immutable records holding only the fields used by the plugin commands. Zabbix API results are projected
+into these records while they are being decoded (see ZabbixClient.call()), so the full JSON documents are never
+kept in memory. Repeated values (host names, notes, trigger hosts, IDs, ...) are shared through a memo dict, which
+lives as long as one decoded API result.
+"""
+from collections import namedtuple
+
+__all__ = ('Acknowledge', 'Event', 'TriggerHost', 'TriggerItem', 'Trigger', 'HostInterface', 'Host')
+
+
+def _shared(memo, value):
+    """Return an equal value which was already seen during decoding of one API result"""
+    if memo is None:
+        return value
+
+    return memo.setdefault(value, value)
+
+
+class Acknowledge(namedtuple('Acknowledge', ('clock', 'message'))):
+    __slots__ = ()
+
+    @classmethod
+    def from_api(cls, obj, memo=None):
+        return cls(int(obj['clock']), _shared(memo, obj['message']))
+
+
+class Event(namedtuple('Event', ('eventid', 'objectid', 'clock', 'value', 'acknowledged', 'acknowledges'))):
+    __slots__ = ()
+
+    @classmethod
+    def from_api(cls, obj, memo=None, acknowledges=True):
+        return cls(int(obj['eventid']), _shared(memo, int(obj.get('objectid', 0))), _shared(memo, int(obj['clock'])),
+                   int(obj['value']), int(obj.get('acknowledged', 0)),
+                   tuple(Acknowledge.from_api(a, memo) for a in obj.get('acknowledges', None) or ())
+                   if acknowledges else ())
+
+
+class TriggerHost(namedtuple('TriggerHost', ('hostid', 'name', 'maintenance_status'))):
+    __slots__ = ()
+
+    @classmethod
+    def from_api(cls, obj, memo=None):
+        # Hosts are shared by many triggers -> the whole record is shared
+        return _shared(memo, cls(_shared(memo, obj['hostid']), _shared(memo, obj.get('name', '')),
+                                 int(obj.get('maintenance_status', 0))))
+
+
+class TriggerItem(namedtuple('TriggerItem', ('itemid', 'name'))):
+    __slots__ = ()
+
+    @classmethod
+    def from_api(cls, obj, memo=None):
+        return cls(int(obj['itemid']), _shared(memo, obj.get('name', '')))
+
+
+class Trigger(namedtuple('Trigger', ('triggerid', 'state', 'error', 'url', 'description', 'priority', 'comments',
+                                     'lastchange', 'hosts', 'items', 'last_event'))):
+    __slots__ = ()
+
+    @classmethod
+    def from_api(cls, obj, memo=None):
+        last_event = obj.get('lastEvent', None)
+        hosts = obj.get('hosts', None)
+        items = obj.get('items', None)
+
+        # The trigger ID and last change are shared with the last event (objectid and clock)
+        # Acknowledges of the last event are not used (they are fetched by event.get)
+        return cls(_shared(memo, int(obj['triggerid'])), int(obj.get('state', 0)), _shared(memo, obj.get('error', '')),
+                   _shared(memo, obj.get('url', '')), _shared(memo, obj.get('description', '')),
+                   int(obj.get('priority', 0)), _shared(memo, obj.get('comments', '')),
+                   _shared(memo, int(obj.get('lastchange', 0))),
+                   tuple([TriggerHost.from_api(h, memo) for h in hosts]) if hosts else (),
+                   tuple([TriggerItem.from_api(i, memo) for i in items]) if items else (),
+                   Event.from_api(last_event, memo, acknowledges=False) if last_event else None)
+
+
+class HostInterface(namedtuple('HostInterface', ('ip', 'dns'))):
+    __slots__ = ()
+
+    @classmethod
+    def from_api(cls, obj, memo=None):
+        return cls(_shared(memo, obj.get('ip', '')), _shared(memo, obj.get('dns', '')))
+
+
+class Host(namedtuple('Host', ('hostid', 'name', 'available', 'maintenance_status', 'status', 'inventory',
+                               'interfaces'))):
+    __slots__ = ()
+    IGNORED_INVENTORY_FIELDS = frozenset(('inventory_mode', 'hostid'))
+
+    @classmethod
+    def from_api(cls, obj, memo=None):
+        inventory = obj.get('inventory', None) or {}  # Empty list if inventory is disabled
+
+        return cls(obj['hostid'], obj['name'], int(obj.get('available', 0)), int(obj.get('maintenance_status', 0)),
+                   int(obj.get('status', 0)),
+                   tuple((_shared(memo, key), _shared(memo, val)) for key, val in inventory.items()
+                         if val and key not in cls.IGNORED_INVENTORY_FIELDS),
+                   tuple(HostInterface.from_api(i, memo) for i in obj.get('interfaces', ())))
@@ -0,0 +1,118 @@
+"""
+This file is part of Ludolph: Zabbix API plugin
+Copyright (C) 2015-2017 Erigones, s. r. o.
+
+See the LICENSE file for copying permission.
+"""
+from threading import Event, Lock
+from time import time
+
+__all__ = ('SingleFlight', 'WaitTimeout')
+
+
+class WaitTimeout(Exception):
+    """
+    Timeout while waiting for the result of an identical call made by another caller.
+    """
+    pass
+
+
+class _Call(object):
+    """
+    One in-flight function call shared by all callers waiting for the result.
+    """
+    __slots__ = ('event', 'result', 'exception', 'followers')
+
+    def __init__(self):
+        self.event = Event()
+        self.result = None
+        self.exception = None
+        self.followers = 0  # Number of callers which have joined the call
+
+
+class SingleFlight(object):
+    """
+    Coalesce identical concurrent function calls into one call and keep their results for a short time.
+
+    Results are shared among all callers and must not be modified.
+    """
+    def __init__(self, ttl=0):
+        self.ttl = ttl  # Result cache time-to-live in seconds (0 = no result caching)
+        self._lock = Lock()
+        self._calls = {}
+        self._cache = {}
+        self._generation = 0  # Incremented by clear(); results of calls started before are not cached
+
+    def __repr__(self):
+        return '%s(ttl=%s)' % (self.__class__.__name__, self.ttl)
+
+    def _purge(self, now):
+        """Remove expired results from cache; must be called with lock held"""
+        for key in [key for key, (expires, _) in self._cache.items() if expires <= now]:
+            del self._cache[key]
+
+    def clear(self):
+        """Drop all cached results and forget calls in progress - their results may be outdated, so they are
+        returned only to callers already waiting for them and are not cached"""
+        with self._lock:
+            self._cache.clear()
+            self._calls.clear()
+            self._generation += 1
+
+    def do(self, key, fun, timeout=None, retry_on=()):
+        """Return result of fun() - run it only if no identical call (same key) is in progress and no cached result
+        exists. WaitTimeout is raised if the result of an identical call is not available within timeout seconds.
+        Exceptions of retry_on types are specific to the caller which has run fun() (e.g. its deadline has run out)
+        and are not shared; the waiting callers run the call again instead"""
+        expires = None if timeout is None else time() + timeout
+
+        while True:
+            with self._lock:
+                try:
+                    expires_at, result = self._cache[key]
+                except KeyError:
+                    pass
+                else:
+                    if expires_at > time():
+                        return result
+
+                call = self._calls.get(key, None)
+
+                if call is None:
+                    call = self._calls[key] = _Call()
+                    generation = self._generation
+                    leader = True
+                else:
+                    call.followers += 1
+                    leader = False
+
+            if leader:
+                break
+
+            if not call.event.wait(None if expires is None else max(expires - time(), 0)):
+                raise WaitTimeout('Timeout while waiting for result of an identical call')
+
+            if call.exception is None:
+                return call.result
+
+            if not isinstance(call.exception, retry_on):
+                raise call.exception
+
+        try:
+            call.result = fun()
+        except Exception as exc:
+            call.exception = exc
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key, None) is call:
+                    del self._calls[key]
+
+                if self.ttl > 0 and call.exception is None and generation == self._generation:
+                    now = time()
+                    self._purge(now)
+                    self._cache[key] = (now + self.ttl, call.result)
+
+            call.event.set()
+
+        return call.result
@@ -0,0 +1,272 @@
+"""
+This file is part of Ludolph: Zabbix API plugin
+Copyright (C) 2015-2017 Erigones, s. r. o.
+
+See the LICENSE file for copying permission.
+"""
+import json
+import logging
+import os
+from threading import Condition, Event, Thread
+
+__all__ = ('AlertSpool', 'SpoolFull')
+
+logger = logging.getLogger(__name__)
+
+
+class SpoolFull(Exception):
+    """
+    The spool file has reached its maximum size.
+    """
+    pass
+
+
+class AlertSpool(object):
+    """
+    Durable append-only spool of records (JSON lines) with a background delivery worker.
+
+    Records are appended to the spool file and fsync-ed in batches by a flusher thread (every fsync_interval seconds;
+    0 = fsync after each record). The delivery worker reads records in bulk, passes them to the deliver callback and
+    saves the offset of the first undelivered record into the <path>.offset file. Delivered records are removed
+    by compaction, which is performed only by the delivery worker.
+    """
+    BATCH_SIZE = 500  # Maximum number of records delivered in one batch
+    RETRY_INTERVAL = 5  # Seconds to wait before next delivery attempt if the deliver callback is not ready or fails
+
+    def __init__(self, path, max_size=67108864, fsync_interval=0.2):
+        self.path = path
+        self.offset_path = path + '.offset'
+        self.max_size = max_size
+        self.fsync_interval = fsync_interval
+        self._cond = Condition()
+        self._stopped = Event()
+        self._threads = []
+        self._dirty = False
+        self._fp = None
+        self._size = 0
+        self._offset = 0
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, self.path)
+
+    def _open(self):
+        """Open spool file and remove incomplete record at the end of file (in case of previous crash)"""
+        self._fp = open(self.path, 'ab')
+        self._size = os.fstat(self._fp.fileno()).st_size
+
+        if self._size:
+            with open(self.path, 'rb') as fp:
+                fp.seek(max(self._size - 65536, 0))
+                tail = fp.read()
+
+            if not tail.endswith(b'\n'):
+                self._size -= len(tail) - (tail.rfind(b'\n') + 1)
+                logger.warning('Removing incomplete record at the end of spool file %s', self.path)
+                self._fp.truncate(self._size)
+                self._fsync()
+
+        try:
+            with open(self.offset_path) as fp:
+                self._offset = int(fp.read().strip() or 0)
+        except (IOError, OSError, ValueError):
+            self._offset = 0
+
+        if not 0 <= self._offset <= self._size:
+            logger.error('Invalid offset in spool file %s. Delivering all records', self.offset_path)
+            self._offset = 0
+
+    def _fsync(self):
+        self._fp.flush()
+        os.fsync(self._fp.fileno())
+        self._dirty = False
+
+    def _save_offset(self, offset):
+        tmp = self.offset_path + '.tmp'
+
+        with open(tmp, 'w') as fp:
+            fp.write(str(offset))
+            fp.flush()
+            os.fsync(fp.fileno())
+
+        os.rename(tmp, self.offset_path)
+        self._offset = offset
+
+    @property
+    def pending(self):
+        """Number of bytes waiting for delivery"""
+        return self._size - self._offset
+
+    def append(self, record):
+        """Append one record (dict) to the spool file"""
+        line = (json.dumps(record, separators=(',', ':')) + '\n').encode('utf-8')
+
+        with self._cond:
+            if self._size + len(line) > self.max_size:
+                raise SpoolFull('Spool file %s is full (%d bytes)' % (self.path, self._size))
+
+            self._fp.write(line)
+            self._fp.flush()
+            self._size += len(line)
+
+            if self.fsync_interval > 0:
+                self._dirty = True
+            else:
+                self._fsync()
+
+            self._cond.notify_all()
+
+    def _read_batch(self):
+        """Return list of (end offset, record) tuples starting from current offset"""
+        res = []
+
+        with self._cond:
+            offset = self._offset
+            size = self._size
+
+            with open(self.path, 'rb') as fp:
+                fp.seek(offset)
+
+                while offset < size and len(res) < self.BATCH_SIZE:
+                    line = fp.readline(size - offset)
+
+                    if not line:
+                        break
+
+                    offset += len(line)
+
+                    try:
+                        record = json.loads(line.decode('utf-8'))
+                    except ValueError:
+                        logger.error('Skipping invalid record in spool file %s: %r', self.path, line)
+                        record = None
+
+                    res.append((offset, record))
+
+        return res
+
+    @staticmethod
+    def _copy(src, dst, start, end):
+        """Copy bytes from start to end offset of src file into dst file"""
+        src.seek(start)
+
+        while start < end:
+            data = src.read(min(end - start, 1048576))
+
+            if not data:
+                break
+
+            dst.write(data)
+            start += len(data)
+
+    def _compact(self):
+        """Remove delivered records from the beginning of spool file. Pending records are copied into a new file
+        without holding the lock; only records appended in the meantime are copied with the lock held. The reset
+        offset is saved before the files are swapped, so a crash in between causes only repeated delivery"""
+        with self._cond:
+            offset = self._offset
+            size = self._size
+
+            if offset == 0:
+                return
+
+            logger.info('Compacting spool file %s (%d bytes delivered, %d bytes pending)', self.path, offset,
+                        self.pending)
+
+            if offset == size:
+                self._save_offset(0)
+                self._fp.truncate(0)
+                self._fsync()
+                self._size = 0
+                return
+
+        tmp = self.path + '.tmp'
+
+        with open(self.path, 'rb') as src, open(tmp, 'wb') as dst:
+            self._copy(src, dst, offset, size)
+            dst.flush()
+            os.fsync(dst.fileno())
+
+            with self._cond:
+                self._copy(src, dst, size, self._size)  # Records appended during the copy
+                dst.flush()
+                os.fsync(dst.fileno())
+                self._save_offset(0)
+                self._fp.close()
+                os.rename(tmp, self.path)
+                self._fp = open(self.path, 'ab')
+                self._size -= offset
+                self._dirty = False
+
+    def _commit(self, offset):
+        """Save offset of delivered records and compact the spool file if needed"""
+        with self._cond:
+            self._save_offset(offset)
+            compact = offset == self._size or offset > self.max_size // 4
+
+        if compact:
+            self._compact()
+
+    def _flusher(self):
+        while not self._stopped.wait(self.fsync_interval):
+            with self._cond:
+                if self._dirty:
+                    self._fsync()
+
+    def _deliver(self, deliver, is_ready):
+        while not self._stopped.is_set():
+            with self._cond:
+                if not self.pending:
+                    self._cond.wait(self.RETRY_INTERVAL)
+                    continue
+
+            if not is_ready():
+                self._stopped.wait(self.RETRY_INTERVAL)
+                continue
+
+            delivered = None
+
+            try:
+                for offset, record in self._read_batch():
+                    if record is not None:
+                        deliver(record)
+
+                    delivered = offset
+            except Exception as exc:
+                logger.exception('Spool delivery failed: %s', exc)
+                self._stopped.wait(self.RETRY_INTERVAL)
+            finally:
+                if delivered is not None:
+                    self._commit(delivered)
+
+    def start(self, deliver, is_ready):
+        """Open the spool file and start the flusher and delivery threads. The deliver callback is called for each
+        record as soon as is_ready() returns True"""
+        self._open()
+
+        if self.pending:
+            logger.warning('Spool file %s contains %d bytes of undelivered records', self.path, self.pending)
+
+        self._threads = [Thread(target=self._deliver, args=(deliver, is_ready), name='spool-deliver')]
+
+        if self.fsync_interval > 0:
+            self._threads.append(Thread(target=self._flusher, name='spool-flusher'))
+
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def stop(self):
+        """Stop all threads and close the spool file"""
+        self._stopped.set()
+
+        with self._cond:
+            self._cond.notify_all()
+
+        for thread in self._threads:
+            thread.join()
+
+        if self._fp:
+            with self._cond:
+                self._fsync()
+                self._fp.close()
+                self._fp = None
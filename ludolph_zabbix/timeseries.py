@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+This file is part of Ludolph: Zabbix API plugin
+Copyright (C) 2015-2017 Erigones, s. r. o.
+
+See the LICENSE file for copying permission.
+"""
+try:
+    # noinspection PyPackageRequirements
+    import numpy
+except ImportError:
+    numpy = None
+
+__all__ = ('Downsampler', 'format_value')
+
+SPARKLINE_CHARS = u'▁▂▃▄▅▆▇█'
+
+
+def format_value(value, units=''):
+    """Return human readable numeric value with units"""
+    return ('%.4g %s' % (value, units or '')).strip()
+
+
+class Downsampler(object):
+    """
+    Fold numeric time series into a fixed number of time buckets (min/avg/max per bucket). Samples are added in
+    chunks, so memory usage does not depend on the number of samples. Chunks are processed with numpy (if available).
+    """
+    def __init__(self, since, until, buckets=60):
+        self.since = int(since)
+        self.until = int(until)
+        self.buckets = buckets
+        self.span = max(self.until - self.since, 1)
+        self.last_clock = None
+        self.last_value = None
+
+        if numpy is None:
+            self.min = [float('inf')] * buckets
+            self.max = [float('-inf')] * buckets
+            self.sum = [0.0] * buckets
+            self.count = [0] * buckets
+        else:
+            self.min = numpy.full(buckets, numpy.inf)
+            self.max = numpy.full(buckets, -numpy.inf)
+            self.sum = numpy.zeros(buckets)
+            self.count = numpy.zeros(buckets, dtype=numpy.int64)
+
+    def __repr__(self):
+        return '%s(%s, %s, buckets=%s)' % (self.__class__.__name__, self.since, self.until, self.buckets)
+
+    def _bucket(self, clock):
+        return min(max((clock - self.since) * self.buckets // self.span, 0), self.buckets - 1)
+
+    def _add(self, clocks, mins, sums, maxs, counts):
+        """Fold one chunk of samples (sequences of equal length) into buckets"""
+        if not len(clocks):
+            return
+
+        if numpy is None:
+            for clock, vmin, vsum, vmax, cnt in zip(clocks, mins, sums, maxs, counts):
+                i = self._bucket(clock)
+                self.min[i] = min(self.min[i], vmin)
+                self.max[i] = max(self.max[i], vmax)
+                self.sum[i] += vsum
+                self.count[i] += cnt
+
+            i = max(range(len(clocks)), key=clocks.__getitem__)
+        else:
+            idx = ((clocks - self.since) * self.buckets // self.span).clip(0, self.buckets - 1)
+            numpy.minimum.at(self.min, idx, mins)
+            numpy.maximum.at(self.max, idx, maxs)
+            numpy.add.at(self.sum, idx, sums)
+            numpy.add.at(self.count, idx, counts)
+            i = int(clocks.argmax())
+
+        if self.last_clock is None or clocks[i] >= self.last_clock:
+            self.last_clock = int(clocks[i])
+            self.last_value = float(sums[i]) / int(counts[i])
+
+    def add_history(self, rows):
+        """Add a chunk of history.get results"""
+        if numpy is None:
+            clocks = [int(r['clock']) for r in rows]
+            values = [float(r['value']) for r in rows]
+            counts = [1] * len(rows)
+        else:
+            n = len(rows)
+            clocks = numpy.fromiter((r['clock'] for r in rows), dtype=numpy.int64, count=n)
+            values = numpy.fromiter((r['value'] for r in rows), dtype=numpy.float64, count=n)
+            counts = numpy.ones(n, dtype=numpy.int64)
+
+        self._add(clocks, values, values, values, counts)
+
+    def add_trends(self, rows):
+        """Add a chunk of trends.get results (hourly min/avg/max values)"""
+        if numpy is None:
+            clocks = [int(r['clock']) for r in rows]
+            counts = [int(r['num']) for r in rows]
+            mins = [float(r['value_min']) for r in rows]
+            maxs = [float(r['value_max']) for r in rows]
+            sums = [float(r['value_avg']) * num for r, num in zip(rows, counts)]
+        else:
+            n = len(rows)
+            clocks = numpy.fromiter((r['clock'] for r in rows), dtype=numpy.int64, count=n)
+            counts = numpy.fromiter((r['num'] for r in rows), dtype=numpy.int64, count=n)
+            mins = numpy.fromiter((r['value_min'] for r in rows), dtype=numpy.float64, count=n)
+            maxs = numpy.fromiter((r['value_max'] for r in rows), dtype=numpy.float64, count=n)
+            sums = numpy.fromiter((r['value_avg'] for r in rows), dtype=numpy.float64, count=n) * counts
+
+        self._add(clocks, mins, sums, maxs, counts)
+
+    @property
+    def total(self):
+        """Number of folded samples"""
+        return int(sum(self.count))
+
+    def stats(self):
+        """Return (min, avg, max) tuple over the whole period or None if there are no samples"""
+        total = self.total
+
+        if not total:
+            return None
+
+        return min(self.min), float(sum(self.sum)) / total, max(self.max)
+
+    def averages(self):
+        """Return list of bucket averages (None for empty buckets)"""
+        return [float(s) / c if c else None for s, c in zip(self.sum, self.count)]
+
+    def sparkline(self):
+        """Return text graph of bucket averages"""
+        avgs = self.averages()
+        values = [i for i in avgs if i is not None]
+
+        if not values:
+            return u''
+
+        low = min(values)
+        scale = (max(values) - low) or 1.0
+        top = len(SPARKLINE_CHARS) - 1
+
+        return u''.join(u' ' if i is None else SPARKLINE_CHARS[int(round((i - low) / scale * top))] for i in avgs)
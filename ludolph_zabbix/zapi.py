@@ -4,17 +4,30 @@ Copyright (C) 2015-2017 Erigones, s. r. o.
 
 See the LICENSE file for copying permission.
 """
+import heapq
+import json
 import logging
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from threading import Event as ThreadingEvent, Lock, Thread
+from time import time
 
 from ludolph_zabbix import __version__
+from ludolph_zabbix.client import ZabbixClient
+from ludolph_zabbix.deadline import Deadline, DeadlineExceeded, activate, with_deadline
+from ludolph_zabbix.eventstats import ProblemStats
+from ludolph_zabbix.hostindex import HostIndex
+from ludolph_zabbix.records import Event, Host, Trigger
+from ludolph_zabbix.singleflight import SingleFlight, WaitTimeout
+from ludolph_zabbix.spool import AlertSpool, SpoolFull
+from ludolph_zabbix.timeseries import Downsampler, format_value
 from ludolph.utils import parse_loglevel
 from ludolph.web import webhook, request, abort
 from ludolph.cron import cronjob
 from ludolph.command import CommandError, command
 from ludolph.message import IncomingLudolphMessage, red, green
 from ludolph.plugins.plugin import LudolphPlugin
-from zabbix_api import ZabbixAPI, ZabbixAPIException, ZabbixAPIError
+from zabbix_api import ZabbixAPIException, ZabbixAPIError
 
 logger = logging.getLogger(__name__)
 
@@ -39,17 +52,39 @@ def event_status(value):
         return 'UNKNOWN'
 
 
+def format_duration(seconds):
+    """Return human readable duration (same format as ZabbixAPI.get_age())"""
+    days, rem = divmod(int(seconds), 86400)
+    hours, rem = divmod(rem, 3600)
+    minutes, seconds = divmod(rem, 60)
+
+    if days:
+        return '%dd %dh %dm' % (days, hours, minutes)
+    else:
+        return '%dh %dm %ds' % (hours, minutes, seconds)
+
+
 class Zapi(LudolphPlugin):
     """
     Zabbix API connector for LudolphBot.
 
     Zabbix >= 2.0.6 is required.
     https://www.zabbix.com/documentation/2.0/manual/appendix/api/api
+
+    Multiple Zabbix servers can be configured (see README). All object IDs (events, maintenances, hosts, groups)
+    are then namespaced by server name (<server>:<ID>).
     """
     __version__ = __version__
-    _zapi = None
-    _zapi_version = None
+    _zapi = None  # Zabbix API connection to the first (default) Zabbix server
+    _spool = None  # Durable queue of incoming alerts
     TIMEOUT = 10
+    ZAPI_VERSION_RETRY = 60  # Seconds before a failed Zabbix API version lookup is repeated
+    CACHE_TTL = 2
+    COMMAND_TIMEOUT = 30
+    DEADLINE_GRACE = 0.5  # Seconds to wait for partial results from zabbix servers after the command deadline
+    SPOOL_MAX_SIZE = 67108864  # 64 MiB
+    SPOOL_FSYNC_INTERVAL = 0.2
+    DEFAULT_SERVER = 'zabbix'
     DURATION_SUFFIXES = {
         's': 'seconds',
         'm': 'minutes',
@@ -66,33 +101,106 @@ class Zapi(LudolphPlugin):
         'hosts': 'hosts.php?groupid=0',
         'hostgroups': 'hostgroups.php',
     }
+    EVENT_OUTPUT = ('eventid', 'objectid', 'clock', 'value', 'acknowledged')
+    EVENT_ACKNOWLEDGES_OUTPUT = ('clock', 'message')
+    NUMERIC_VALUE_TYPES = (0, 3)  # numeric float, numeric unsigned
+    HISTORY_BUCKETS = 60
+    HISTORY_CHUNK = 10000  # Maximum number of history values (or trend hours) fetched by one API call
+    HISTORY_MAX_ITEMS = 10
+    HISTORY_TRENDS_PERIOD = 172800  # Use trends for periods longer than 2 days
+    LATEST_PAGE_SIZE = 1000  # Maximum number of hosts per one item.get call
+    LATEST_MAX_ROWS = 200
+    TOP_DEFAULT = 10
+    TOP_MAX = 100
+    TOP_PAGE_SIZE = 10000  # Maximum number of events fetched by one event.get call
+    TOP_TRIGGERS_CHUNK = 1000  # Maximum number of triggers per one trigger.get call
+    TOP_EVENTS_BUDGET = 0.8  # Part of the remaining command deadline used for fetching events
+    HOST_OUTPUT = ('hostid', 'name', 'available', 'maintenance_status', 'status')
+    HOST_INDEX_INTERVAL = 300  # Seconds between host index refreshes
+    HOST_INDEX_SLICE = 500  # Number of already indexed hosts re-fetched during one host index refresh
+    HOST_INDEX_CHUNK = 1000  # Maximum number of hosts per one host.get call
 
     def __init__(self, *args, **kwargs):
         super(Zapi, self).__init__(*args, **kwargs)
+        self._zapis = OrderedDict()  # Zabbix server name -> ZabbixClient
+        self._zapi_versions = {}
+        self._zapi_version_errors = {}  # Zabbix server name -> (expires, exception)
         self._web_links_cache = {}
+        # Identical concurrent read-only API calls are coalesced and their results are cached for a short time
+        self._single_flight = SingleFlight(ttl=float(self.config.get('cache_ttl', self.CACHE_TTL)))
+        # Overall time budget of one command (0 = no limit)
+        self.command_timeout = float(self.config.get('command_timeout', self.COMMAND_TIMEOUT))
+        self._host_indexes = OrderedDict()  # Zabbix server name -> HostIndex
+        self._host_index_stopped = ThreadingEvent()
 
     def __post_init__(self):
-        """Log in to zabbix"""
+        """Log in to all configured zabbix servers"""
+        servers = self.config.get('servers', '').replace(',', ' ').split()
+
+        if servers:
+            for name in servers:
+                self._zapi_login(name, prefix=name + '.')
+        else:
+            self._zapi_login(self.DEFAULT_SERVER)
+
+        self._zapi = next(iter(self._zapis.values()))
+
+        spool = self.config.get('spool', None)
+
+        if spool:
+            self._spool = AlertSpool(spool, max_size=int(self.config.get('spool_max_size', self.SPOOL_MAX_SIZE)),
+                                     fsync_interval=float(self.config.get('spool_fsync_interval',
+                                                                          self.SPOOL_FSYNC_INTERVAL)))
+            self._spool.start(self._send_alert, self.xmpp.client.session_started_event.is_set)
+
+        host_index_interval = int(self.config.get('host_index_interval', self.HOST_INDEX_INTERVAL))
+
+        if host_index_interval > 0:
+            self._host_indexes.update((name, HostIndex()) for name in self._zapis)
+            thread = Thread(target=self._host_index_worker, args=(host_index_interval,), name='zabbix-host-index')
+            thread.daemon = True
+            thread.start()
+
+    def __destroy__(self):
+        """Stop the alert spool and host index refreshes"""
+        self._host_index_stopped.set()
+
+        if self._spool:
+            self._spool.stop()
+            self._spool = None
+
+    def _zapi_login(self, name, prefix=''):
+        """Initialize zapi for one zabbix server and try to login. Server specific settings are prefixed by the
+        server name and fall back to global settings"""
         config = self.config
 
+        def get_config(key, default=None):
+            return config.get(prefix + key, config.get(key, default))
+
         # Initialize zapi and try to login
-        timeout = int(config.get('timeout', self.TIMEOUT))
+        timeout = int(get_config('timeout', self.TIMEOUT))
         # HTTP authentication?
-        httpuser = config.get('httpuser', None)
-        httppasswd = config.get('httppasswd', None)
+        httpuser = get_config('httpuser', None)
+        httppasswd = get_config('httppasswd', None)
         # Whether to verify HTTPS server certificate (requires zabbix-api-erigones >= 1.2.2)
-        ssl_verify = self.get_boolean_value(config.get('ssl_verify', True))
+        ssl_verify = self.get_boolean_value(get_config('ssl_verify', True))
+        # Request gzip/deflate compressed responses
+        compression = self.get_boolean_value(get_config('compression', True))
+        # JSON library used for decoding responses (auto = the fastest installed one)
+        json_codec = get_config('json_codec', 'auto')
 
         # noinspection PyTypeChecker
-        self._zapi = ZabbixAPI(server=config['server'], user=httpuser, passwd=httppasswd, timeout=timeout,
-                               log_level=parse_loglevel(config.get('loglevel', 'INFO')), ssl_verify=ssl_verify)
+        self._zapis[name] = _zapi = ZabbixClient(server=config[prefix + 'server'], user=httpuser, passwd=httppasswd,
+                                                 timeout=timeout, ssl_verify=ssl_verify, compression=compression,
+                                                 json_codec=json_codec,
+                                                 log_level=parse_loglevel(get_config('loglevel', 'INFO')))
 
         # Login and save zabbix credentials
         try:
-            logger.info('Zabbix API login')
-            self._zapi.login(config['username'], config['password'], save=True)
+            logger.info('Zabbix API login (%s)', name)
+            _zapi.login(get_config('username'), get_config('password'), save=True)
         except ZabbixAPIException as e:
-            logger.critical('Zabbix API login error (%s)', e)
+            logger.critical('Zabbix API login error (%s: %s)', name, e)
 
     @staticmethod
     def _parse_datetime(value, param_name):
@@ -134,39 +242,236 @@ class Zapi(LudolphPlugin):
                 raise CommandError('Invalid parameter: **%s**. Duration or date-time required! (format: '
                                    '%s<duration{s|m|h|d}> or <YYYY-mm-dd-HH-MM>)' % (param_name, duration_symbol))
 
-    def zapi(self, method, params=None):
+    def _get_zapi(self, server=None):
+        """Return ZabbixClient object for zabbix server name (default server is used if server is None)"""
+        if server is None:
+            return self._zapi
+
+        return self._zapis[server]
+
+    @staticmethod
+    def _zapi_call(_zapi, method, params, record=None):
+        """Execute zabbix API command and convert zabbix API errors into command errors. The API call timeout is
+        shortened to fit into the deadline of the current command; a failure caused by the shortened timeout is
+        reported as DeadlineExceeded"""
+        deadline = Deadline.current()
+        shortened = False
+
+        if deadline is None:
+            timeout = None
+        else:
+            deadline.check()
+            timeout = max(min(_zapi.timeout, deadline.remaining()), 0.01)
+            shortened = timeout < _zapi.timeout
+
+        start_time = time()
+
+        try:
+            return _zapi.call(method, params=params, record=record, timeout=timeout)
+        except ZabbixAPIError as ex:  # API command/application problem
+            raise CommandError('%(message)s %(code)s: %(data)s' % ex.error)
+        except ZabbixAPIException as ex:
+            if deadline is not None and (deadline.expired or (shortened and time() - start_time >= timeout)):
+                raise deadline.error()
+
+            raise CommandError('Zabbix API error (%s)' % ex)  # API connection/transport problem problem
+
+    def zapi(self, method, params=None, server=None, cache=True, record=None):
         """
         Acts as a decorator for executing zabbix API commands and checking zabbix API errors.
+
+        Identical concurrent read-only (*.get) calls share one API request (unless cache is False). The returned
+        objects may be therefore shared with other callers and must not be modified.
+
+        Result lists can be projected into compact records (see ludolph_zabbix.records) during decoding.
+
+        DeadlineExceeded is raised if the deadline of the current command has run out.
         """
+        _zapi = self._get_zapi(server)
+        deadline = Deadline.current()
+
+        if deadline is not None:
+            deadline.check()  # Do not start new API calls
+
         # Was never logged in. Repair authentication settings and restart Ludolph.
-        if not (self._zapi and self._zapi.logged_in):
+        if not (_zapi and _zapi.logged_in):
             raise CommandError('Zabbix API not available')
 
+        if method.endswith('.get'):
+            if not cache:  # Large or one-time results
+                return self._zapi_call(_zapi, method, params, record=record)
+
+            key = (_zapi.server, method, record, json.dumps(params, sort_keys=True, default=str))
+            try:
+                # DeadlineExceeded of another caller is not shared - a waiting caller repeats the call on its own
+                return self._single_flight.do(key, lambda: self._zapi_call(_zapi, method, params, record=record),
+                                              timeout=None if deadline is None else deadline.remaining(),
+                                              retry_on=(DeadlineExceeded,))
+            except WaitTimeout:  # Only with a deadline; the deadline may still seem unexpired (different clocks)
+                raise deadline.error()
+
         try:
-            return self._zapi.call(method, params=params)
-        except ZabbixAPIError as ex:  # API command/application problem
-            raise CommandError('%(message)s %(code)s: %(data)s' % ex.error)
-        except ZabbixAPIException as ex:
-            raise CommandError('Zabbix API error (%s)' % ex)  # API connection/transport problem problem
+            return self._zapi_call(_zapi, method, params)
+        finally:
+            self._single_flight.clear()  # Something has changed
+
+    def _call_servers(self, fun, servers=None):
+        """
+        Run fun(server) for all (or selected) zabbix servers concurrently. Return a list of (server, result) tuples
+        (in server configuration order) and a list of error messages from failed servers. The exception is re-raised
+        if all servers failed. The deadline of the current command applies to all servers; servers which do not
+        respond in time are reported as failed.
+        """
+        if servers is None:
+            servers = list(self._zapis.keys())
+
+        if len(servers) == 1:  # Nothing to run concurrently
+            return [(servers[0], fun(servers[0]))], []
+
+        results = {}
+        exceptions = {}
+        closed = []  # Non-empty -> late results are ignored
+        lock = Lock()
+        deadline = Deadline.current()
+
+        def run(name):
+            try:
+                with activate(deadline):
+                    # Web links in the command output depend on the API version of each server
+                    self._prefetch_zapi_version(name)
+                    res = fun(name)
+            except Exception as exc:
+                with lock:
+                    if not closed:
+                        exceptions[name] = exc
+            else:
+                with lock:
+                    if not closed:
+                        results[name] = res
+
+        threads = [Thread(target=run, args=(server,), name='zapi-%s' % server) for server in servers]
+
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        # Total latency is that of the slowest server (or the command deadline)
+        for thread in threads:
+            thread.join(None if deadline is None else deadline.remaining() + self.DEADLINE_GRACE)
+
+        with lock:
+            closed.append(True)  # Ignore late results
+
+        errors = []
+
+        for server in servers:
+            if server not in results and server not in exceptions:
+                exceptions[server] = deadline.error()
+
+        for server in servers:
+            if server in exceptions:
+                if not results:
+                    raise exceptions[server]
+
+                logger.error('Zabbix server "%s" failed: %s', server, exceptions[server])
+                errors.append('Server **%s** error: %s' % (server, exceptions[server]))
+
+        return [(server, results[server]) for server in servers if server in results], errors
+
+    def _server_id(self, server, objid):
+        """Return object ID namespaced by zabbix server name (only if multiple zabbix servers are configured)"""
+        if len(self._zapis) > 1:
+            return '%s:%s' % (server, objid)
+
+        return objid
+
+    def _parse_server_id(self, value, param_name):
+        """Parse [server:]ID string into (server name, integer ID) tuple"""
+        server, _, objid = str(value).rpartition(':')
+
+        if server:
+            if server not in self._zapis:
+                raise CommandError('Invalid parameter: **%s**. Unknown Zabbix server **%s**!' % (param_name, server))
+        elif len(self._zapis) > 1:
+            raise CommandError('Invalid parameter: **%s**. Zabbix server name required! (format: <server>:<ID>)' %
+                               param_name)
+        else:
+            server = next(iter(self._zapis.keys()))
+
+        try:
+            return server, int(objid)
+        except ValueError:
+            raise CommandError('Invalid parameter: **%s**. Integer required!' % param_name)
+
+    def _group_server_ids(self, ids, param_name):
+        """Parse a list of [server:]ID strings and return OrderedDict mapping server names to lists of IDs"""
+        res = OrderedDict()
+
+        for i in ids:
+            server, objid = self._parse_server_id(i, param_name)
+            res.setdefault(server, []).append(objid)
+
+        return res
+
+    def _get_zapi_version(self, flush_cache=False, server=None):
+        """Return Zabbix API version. A failed lookup is remembered for ZAPI_VERSION_RETRY seconds"""
+        if server is None:
+            server = next(iter(self._zapis.keys()))
+
+        if not flush_cache:
+            try:
+                return self._zapi_versions[server]
+            except KeyError:
+                pass
+
+            try:
+                expires, exc = self._zapi_version_errors[server]
+            except KeyError:
+                pass
+            else:
+                if expires > time():
+                    raise exc
+
+        _zapi = self._get_zapi(server)
+        deadline = Deadline.current()
+
+        try:
+            version = str(self._single_flight.do((_zapi.server, 'apiinfo.version'),
+                                                 lambda: self._zapi_call(_zapi, 'apiinfo.version', None),
+                                                 timeout=None if deadline is None else deadline.remaining(),
+                                                 retry_on=(DeadlineExceeded,)))
+        except WaitTimeout:
+            raise deadline.error()
+        except DeadlineExceeded:
+            raise  # Not a server failure
+        except CommandError as exc:
+            logger.error('Zabbix API error while fetching Zabbix API version (%s): %s', server, exc)
+            self._zapi_version_errors[server] = (time() + self.ZAPI_VERSION_RETRY, exc)
+            raise
+
+        self._zapi_version_errors.pop(server, None)
+        self._zapi_versions[server] = version
+        self._web_links_cache = {}
 
-    def _get_zapi_version(self, flush_cache=False):
-        """Return Zabbix API version"""
-        if flush_cache or self._zapi_version is None:
-            self._zapi_version = str(self._zapi.api_version())
-            self._web_links_cache = {}
+        return version
 
-        return self._zapi_version
+    def _prefetch_zapi_version(self, server):
+        """Fetch Zabbix API version (needed for web links) unless it is already known"""
+        if server not in self._zapi_versions:
+            try:
+                self._get_zapi_version(server=server)
+            except CommandError:
+                pass  # Already logged; web links fall back to the default format
 
-    def _get_web_link(self, item, **params):
+    def _get_web_link(self, item, server=None, **params):
         """Return appropriate HTTP link to the Zabbix web interface"""
-        web_link = self._web_links_cache.get(item, None)
+        web_link = self._web_links_cache.get((server, item), None)
 
         if not web_link:
             try:
                 # noinspection PyNoneFunctionAssignment
-                zapi_version = self._get_zapi_version()
-            except ZabbixAPIException as ex:
-                logger.error('Zabbix API error while fetching Zabbix API version: %s', ex)
+                zapi_version = self._get_zapi_version(server=server)
+            except CommandError:  # Already logged or the command deadline has run out
                 web_link = self.WEB_LINKS[item]
             else:
                 if zapi_version:
@@ -185,12 +490,20 @@ class Zapi(LudolphPlugin):
                 else:
                     _web_link = self.WEB_LINKS[item]
 
-                web_link = self._web_links_cache[item] = self._zapi.server + '/' + _web_link
+                web_link = self._web_links_cache[(server, item)] = self._get_zapi(server).server + '/' + _web_link
 
         return web_link.format(**params)
 
-    def _search_hosts(self, *host_strings):
+    def _get_web_links(self, item):
+        """Return HTTP links to the Zabbix web interface of all zabbix servers"""
+        if len(self._zapis) > 1:
+            return '\n'.join('%s: %s' % (server, self._get_web_link(item, server=server)) for server in self._zapis)
+
+        return self._get_web_link(item)
+
+    def _search_hosts(self, *host_strings, **kwargs):
         """Search zabbix hosts by multiple host search strings. Return dict mapping of host IDs to host names"""
+        server = kwargs.get('server', None)
         res = {}
         params = {
             'output': ['hostid', 'name'],
@@ -201,13 +514,14 @@ class Zapi(LudolphPlugin):
         for host_str in host_strings:
             params['search'] = {'name': host_str}
 
-            for host in self.zapi('host.get', params):
+            for host in self.zapi('host.get', params, server=server):
                 res[host['hostid']] = host['name']
 
         return res
 
-    def _search_groups(self, *group_strings):
+    def _search_groups(self, *group_strings, **kwargs):
         """Search zabbix host groups by multiple group search strings. Return dict mapping group IDs to group names"""
+        server = kwargs.get('server', None)
         res = {}
         params = {
             'output': ['groupid', 'name'],
@@ -218,15 +532,84 @@ class Zapi(LudolphPlugin):
         for group_str in group_strings:
             params['search'] = {'name': group_str}
 
-            for host in self.zapi('hostgroup.get', params):
+            for host in self.zapi('hostgroup.get', params, server=server):
                 res[host['groupid']] = host['name']
 
         return res
 
+    def _refresh_host_index(self, server):
+        """Remove deleted hosts from the host index and fetch new hosts and a round-robin slice of indexed hosts"""
+        index = self._host_indexes[server]
+        hostids = set(h['hostid'] for h in self.zapi('host.get', {'output': ['hostid']}, server=server, cache=False))
+        known = index.hostids()
+        index.remove(known - hostids)
+        refresh = list(hostids - known)
+        refresh.extend(index.next_slice(self.HOST_INDEX_SLICE))
+        params = {
+            'output': list(self.HOST_OUTPUT),
+            'selectInventory': 1,  # All inventory items
+            'selectInterfaces': ['ip', 'dns'],
+        }
+
+        for i in range(0, len(refresh), self.HOST_INDEX_CHUNK):
+            params['hostids'] = refresh[i:i + self.HOST_INDEX_CHUNK]
+            index.update(self.zapi('host.get', params, server=server, cache=False, record=Host))
+
+        return len(index)
+
+    def _host_index_worker(self, interval):
+        """Refresh host indexes of all zabbix servers periodically"""
+        while not self._host_index_stopped.is_set():
+            try:
+                results, errors = self._call_servers(self._refresh_host_index, servers=list(self._host_indexes))
+            except Exception as exc:
+                logger.error('Host index refresh failed: %s', exc)
+            else:
+                for server, count in results:
+                    logger.debug('Host index of zabbix server "%s" contains %d hosts', server, count)
+
+                for error in errors:
+                    logger.error('Host index refresh failed: %s', error)
+
+            self._host_index_stopped.wait(interval)
+
+    def _search_host_index(self, query):
+        """Search hosts in local host indexes. Return list of (server, Host) tuples, list of errors and the time when
+        the least recently fetched host was fetched from zabbix API (None if no host was found)"""
+        if not self._host_indexes:
+            raise CommandError('Host index is disabled')
+
+        try:
+            query = HostIndex.parse_query(query)
+        except ValueError as exc:
+            raise CommandError('Invalid parameter: **%s**. Host name search string or field:value required!' % exc)
+
+        hosts = []
+        errors = []
+        fetched = []
+
+        for server, index in self._host_indexes.items():
+            if index.updated is None:
+                errors.append('Server **%s** error: Host index is not ready yet' % server)
+            else:
+                found = index.search(query)
+                hosts.extend((server, host) for host in found)
+
+                if found:
+                    fetched.append(index.fetched(host.hostid for host in found))
+
+        if len(errors) == len(self._host_indexes):
+            raise CommandError('Host index is not ready yet. Please try again later.')
+
+        if len(self._host_indexes) > 1:
+            hosts.sort(key=lambda x: x[1].name)
+
+        return hosts, errors, min(fetched) if fetched else None
+
     @webhook('/alert', methods=('POST',))
     def alert(self):
         """
-        Process zabbix alert request and send xmpp message to user/room.
+        Process zabbix alert request and send xmpp message to user/room (or store it in the alert spool).
         """
         jid = request.forms.get('jid', None)
 
@@ -244,13 +627,31 @@ class Zapi(LudolphPlugin):
                 abort(400, 'Invalid message type in alert request')
 
         msg = request.forms.get('msg', '')
-        logger.info('Sending monitoring alert to "%s"', jid)
-        logger.debug('\twith body: "%s"', msg)
-        self.xmpp.msg_send(jid, msg, mtype=mtype)
+
+        if self._spool:
+            logger.info('Queuing monitoring alert for "%s"', jid)
+            logger.debug('\twith body: "%s"', msg)
+
+            try:
+                self._spool.append({'jid': jid, 'mtype': mtype, 'msg': msg})
+            except SpoolFull as exc:
+                logger.error('Unable to queue monitoring alert for "%s": %s', jid, exc)
+                abort(503, 'Alert spool is full')
+
+            return 'Message queued'
+
+        self._send_alert({'jid': jid, 'mtype': mtype, 'msg': msg})
 
         return 'Message sent'
 
+    def _send_alert(self, alert):
+        """Send one monitoring alert (dict with jid, mtype and msg) to user/room"""
+        logger.info('Sending monitoring alert to "%s"', alert['jid'])
+        logger.debug('\twith body: "%s"', alert['msg'])
+        self.xmpp.msg_send(alert['jid'], alert['msg'], mtype=alert['mtype'])
+
     # noinspection PyUnusedLocal
+    @with_deadline
     @command
     def zabbix_version(self, msg):
         """
@@ -258,15 +659,20 @@ class Zapi(LudolphPlugin):
 
         Usage: zabbix-version
         """
-        try:
-            return 'Zabbix API version: ' + self._get_zapi_version(flush_cache=True)
-        except ZabbixAPIException as ex:
-            CommandError('Zabbix API error (%s)' % ex)  # API connection/transport problem problem
+        versions, errors = self._call_servers(lambda server: self._get_zapi_version(flush_cache=True, server=server))
+
+        if len(self._zapis) > 1:
+            out = ['Zabbix API version (%s): %s' % (server, version) for server, version in versions]
+        else:
+            out = ['Zabbix API version: %s' % version for server, version in versions]
+
+        return '\n'.join(out + errors)
 
     def _get_alerts(self, groupids=None, hostids=None, monitored=True, maintenance=False, skip_dependent=True,
                     expand_description=False, select_hosts=('hostid',), active_only=True, priority=None,
-                    output=('triggerid', 'state', 'error', 'description', 'priority', 'lastchange'), **kwargs):
-        """Return iterator of current zabbix triggers"""
+                    output=('triggerid', 'state', 'error', 'description', 'priority', 'lastchange'), server=None,
+                    **kwargs):
+        """Return iterator of current zabbix triggers (Trigger records)"""
         params = {
             'groupids': groupids,
             'hostids': hostids,
@@ -288,18 +694,19 @@ class Zapi(LudolphPlugin):
         params.update(kwargs)
 
         # If trigger is lost (broken expression) we skip it
-        return (trigger for trigger in self.zapi('trigger.get', params) if trigger['hosts'])
+        return (trigger for trigger in self.zapi('trigger.get', params, server=server, record=Trigger)
+                if trigger.hosts)
 
-    def _get_alert_events(self, triggers, since=None, until=None):
-        """Get all events related to triggers"""
-        triggerids = [t['triggerid'] for t in triggers]
+    def _get_alert_events(self, triggers, since=None, until=None, server=None):
+        """Get all events (Event records) related to triggers"""
+        triggerids = [t.triggerid for t in triggers]
         events = {}
         params = {
             'triggerids': triggerids,
             'object': 0,  # 0 - trigger
             'source': 0,  # 0 - event created by a trigger
-            'output': 'extend',
-            'select_acknowledges': 'extend',
+            'output': self.EVENT_OUTPUT,
+            'select_acknowledges': self.EVENT_ACKNOWLEDGES_OUTPUT,
             'sortfield': ['clock', 'eventid'],
             'sortorder': 'DESC',
             'nodeids': 0,
@@ -308,61 +715,72 @@ class Zapi(LudolphPlugin):
         if since and until:
             params['time_from'] = since
             params['time_till'] = until
-        else:  # Max 15 days
-            since = datetime.now() - timedelta(days=15)
+        else:  # Max 15 days (rounded to minutes, so that identical concurrent requests can be coalesced)
+            since = datetime.now().replace(second=0, microsecond=0) - timedelta(days=15)
             params['time_from'] = since.strftime('%s')
 
-        for e in self.zapi('event.get', params):
-            events.setdefault(e['objectid'], []).append(e)
+        for e in self.zapi('event.get', params, server=server, record=Event):
+            events.setdefault(e.objectid, []).append(e)
 
         # Because of time limits, there may be some missing events for some trigger IDs
-        missing_eventids = [t['lastEvent']['eventid'] for t in triggers if
-                            t['lastEvent'] and t['triggerid'] not in events]
+        missing_eventids = [t.last_event.eventid for t in triggers if t.last_event and t.triggerid not in events]
 
         if missing_eventids:
-            for e in self.zapi('event.get', {'eventids': missing_eventids, 'source': 0, 'output': 'extend',
-                                             'select_acknowledges': 'extend', 'nodeids': 0}):
-                events.setdefault(e['objectid'], []).append(e)
+            for e in self.zapi('event.get', {'eventids': missing_eventids, 'source': 0, 'output': self.EVENT_OUTPUT,
+                                             'select_acknowledges': self.EVENT_ACKNOWLEDGES_OUTPUT, 'nodeids': 0},
+                               server=server, record=Event):
+                events.setdefault(e.objectid, []).append(e)
 
         return events
 
+    def _get_server_alerts(self, server, t_options, hosts_or_groups=(), since=None, until=None):
+        """Fetch triggers, related events and matched host and group names from one zabbix server.
+        Return None if hosts_or_groups were specified, but no matching host or group exists on the server.
+        Events are None if the command deadline was exceeded before they were fetched"""
+        t_options = dict(t_options)
+        host_names = group_names = ()
+
+        if hosts_or_groups:
+            hosts = self._search_hosts(*hosts_or_groups, server=server)
+
+            if hosts:
+                t_options['hostids'] = list(hosts.keys())
+                host_names = hosts.values()
+            else:
+                groups = self._search_groups(*hosts_or_groups, server=server)
+
+                if groups:
+                    t_options['groupids'] = list(groups.keys())
+                    group_names = groups.values()
+                else:
+                    return None
+
+        triggers = list(self._get_alerts(server=server, **t_options))
+        # Get notes (dict) = related events + acknowledges
+        try:
+            events = self._get_alert_events(triggers, since=since, until=until, server=server)
+        except DeadlineExceeded:  # Show at least the triggers
+            events = None
+
+        return triggers, events, host_names, group_names
+
     # noinspection PyUnusedLocal
     def _show_alerts(self, msg, since=None, until=None, last=None, display_notes=True, display_items=True,
                      hosts_or_groups=()):
         """Show current or historical events (alerts)"""
         _zapi = self._zapi
-        zapi_server = _zapi.server
         get_datetime = _zapi.get_datetime
         out = []
         # Get triggers
-        t_output = ('triggerid', 'state', 'error', 'url', 'expression', 'description', 'priority', 'type', 'comments',
-                    'lastchange')
-        t_hosts = ('hostid', 'name', 'maintenance_status', 'maintenance_type', 'maintenanceid')
+        t_output = ('triggerid', 'state', 'error', 'url', 'description', 'priority', 'comments', 'lastchange')
+        t_hosts = ('hostid', 'name', 'maintenance_status')
         t_options = {'expand_description': True, 'output': t_output, 'select_hosts': t_hosts}
 
-        if hosts_or_groups or last or (since and until):
-            footer = []
-        else:
-            footer = [self._get_web_link('triggers')]
+        footer = []
 
         if display_items:
             t_options['selectItems'] = ('itemid', 'name')
 
-        if hosts_or_groups:
-            hosts = self._search_hosts(*hosts_or_groups)
-
-            if hosts:
-                t_options['hostids'] = list(hosts.keys())
-                footer.append('Hosts: ' + ', '.join(hosts.values()))
-            else:
-                groups = self._search_groups(*hosts_or_groups)
-
-                if groups:
-                    t_options['groupids'] = list(groups.keys())
-                    footer.append('Groups: ' + ', '.join(groups.values()))
-                else:
-                    raise CommandError('Invalid parameter: **host/group**. Existing host/group required!')
-
         if since and until:
             dt_until = self._parse_datetime(until, 'end')
             dt_since = self._parse_datime_or_duration(since, 'start', end_time=dt_until)
@@ -381,32 +799,61 @@ class Zapi(LudolphPlugin):
                 t_options['active_only'] = False
                 footer.append('Last: %d' % last)
 
-        # Fetch triggers
-        triggers = list(self._get_alerts(**t_options))
-        triggers_hidden = 0
+        # Fetch triggers and events from all zabbix servers
+        results, errors = self._call_servers(lambda server: self._get_server_alerts(server, t_options,
+                                                                                    hosts_or_groups=hosts_or_groups,
+                                                                                    since=since, until=until))
+        results = [(server, res) for server, res in results if res is not None]
 
-        # Get notes (dict) = related events + acknowledges
-        events = self._get_alert_events(triggers, since=since, until=until)
+        if not (hosts_or_groups or last or (since and until)):
+            footer.insert(0, self._get_web_links('triggers'))  # API versions are already fetched by _call_servers
 
-        for trigger in triggers:
-            related_events = events.get(trigger['triggerid'], ())
+        if hosts_or_groups:
+            if not (results or errors):
+                raise CommandError('Invalid parameter: **host/group**. Existing host/group required!')
+
+            host_names = [name for server, res in results for name in res[2]]
+            group_names = [name for server, res in results for name in res[3]]
+
+            if host_names:
+                footer.append('Hosts: ' + ', '.join(host_names))
+            if group_names:
+                footer.append('Groups: ' + ', '.join(group_names))
+
+        if any(res[1] is None for server, res in results):
+            footer.append('**Partial results**: events are not shown (command deadline exceeded)')
+
+        # Merge triggers from all zabbix servers ordered by last change
+        triggers = [(server, trigger, res[1]) for server, res in results for trigger in res[0]]
+        triggers.sort(key=lambda x: x[1].lastchange, reverse=True)
+
+        if last is not None:
+            triggers = triggers[:last]
+
+        triggers_hidden = 0
+
+        for server, trigger, events in triggers:
+            if events is None:  # Partial results
+                related_events = None
+            else:
+                related_events = events.get(trigger.triggerid, ())
 
             # Skip triggers without any PROBLEM events. These events usually exist for newly created hosts,
             # but it will also skip triggers without PROBLEM events in historical view (Issue #6)
-            if all(int(e['value']) == 0 for e in related_events):
+            if related_events is not None and all(e.value == 0 for e in related_events):
                 triggers_hidden += 1
                 continue
 
             # Event
-            last_event = trigger['lastEvent']
+            last_event = trigger.last_event
             if last_event:
-                eventid = last_event['eventid']
+                eventid = self._server_id(server, last_event.eventid)
 
-                if int(last_event['value']):  # Problem or unknown state
+                if last_event.value:  # Problem or unknown state
                     eventid = '**%s**' % eventid
 
                 # Ack
-                if int(last_event['acknowledged']):
+                if last_event.acknowledged:
                     ack = '^^**ACK**^^'
                 else:
                     ack = ''
@@ -416,56 +863,57 @@ class Zapi(LudolphPlugin):
                 ack = ''
 
             # Host and hostname
-            host = trigger['hosts'][0]
-            hostname = host['name']
-            if int(host['maintenance_status']):
+            host = trigger.hosts[0]
+            hostname = host.name
+            if host.maintenance_status:
                 hostname += ' **++**'  # some kind of maintenance
 
             # Trigger description
-            desc = str(trigger['description'])
-            if trigger['error'] or int(trigger['state']):
+            desc = str(trigger.description)
+            if trigger.error or trigger.state:
                 desc += ' **??**'  # some kind of trigger error
 
             # Priority
-            prio = _zapi.get_severity(trigger['priority']).ljust(12)
+            prio = _zapi.get_severity(trigger.priority).ljust(12)
 
             # Last change and age
-            dt = get_datetime(trigger['lastchange'])
+            dt = get_datetime(trigger.lastchange)
             age = '^^%s^^' % _zapi.get_age(dt)
 
             comments = ''
-            if trigger['error']:
-                comments += '\n\t\t^^**Error:** %s^^' % trigger['error']
+            if trigger.error:
+                comments += '\n\t\t^^**Error:** %s^^' % trigger.error
 
-            if trigger['comments']:
-                comments += '\n\t\t^^Note: %s^^' % trigger['comments'].strip()
+            if trigger.comments:
+                comments += '\n\t\t^^Note: %s^^' % trigger.comments.strip()
 
-            if trigger['url']:
-                comments += '\n\t\t^^URL: %s^^' % trigger['url'].strip()
+            if trigger.url:
+                comments += '\n\t\t^^URL: %s^^' % trigger.url.strip()
 
             if display_items:
                 # Link to latest data graph
-                history_links = ['[[%s|%s]]' % (self._get_web_link('history', itemid=i['itemid']), i['name'])
-                                 for i in trigger['items']]
+                history_links = ['[[%s|%s]]' % (self._get_web_link('history', server=server, itemid=i.itemid),
+                                                i.name) for i in trigger.items]
                 latest_data = '\n\t\tLatest data: %s' % ', '.join(history_links)
             else:
                 latest_data = ''
 
             trigger_events = []
             if display_notes:
-                for e in related_events:
-                    if int(e['acknowledged']):
+                for e in related_events or ():
+                    if e.acknowledged:
                         e_ack = '^^**ACK**^^'
                     else:
                         e_ack = ''
 
-                    trigger_events.append('\n\t\tEvent: %s\t%s\t^^**%s**^^\t%s' % (e['eventid'],
-                                                                                   get_datetime(e['clock']),
-                                                                                   event_status(e['value']),
+                    e_id = self._server_id(server, e.eventid)
+                    trigger_events.append('\n\t\tEvent: %s\t%s\t^^**%s**^^\t%s' % (e_id,
+                                                                                   get_datetime(e.clock),
+                                                                                   event_status(e.value),
                                                                                    e_ack))
 
-                    for a in e['acknowledges']:
-                        trigger_events.append('\n\t\t\t * __%s: %s__' % (_zapi.get_datetime(a['clock']), a['message']))
+                    for a in e.acknowledges:
+                        trigger_events.append('\n\t\t\t * __%s: %s__' % (_zapi.get_datetime(a.clock), a.message))
 
             if trigger_events:
                 last_change = ''
@@ -481,9 +929,11 @@ class Zapi(LudolphPlugin):
             stat += '\n(%d issues are hidden)' % triggers_hidden
         out.append(stat)
         out.extend(footer)
+        out.extend(errors)
 
         return '\n'.join(out)
 
+    @with_deadline
     @command
     def alerts(self, msg, *args):
         """
@@ -520,6 +970,7 @@ attached to each event ID. Alerts can be optionally filtered by host or group na
         return self._show_alerts(msg, since=start_time, until=end_time, last=last, display_notes=notes,
                                  display_items=items, hosts_or_groups=args)
 
+    @with_deadline
     @command
     def ack(self, msg, eventid, *eventids_or_note):
         """
@@ -532,10 +983,15 @@ attached to each event ID. Alerts can be optionally filtered by host or group na
         Usage: ack all [note]
         """
         note = 'ack'
+        errors = []
 
         if eventid == 'all':
-            eventids = [t['lastEvent']['eventid'] for t in self._get_alerts(withLastEventUnacknowledged=True) if
-                        t['lastEvent']]
+            def get_unacknowledged(server):
+                return [t.last_event.eventid for t in self._get_alerts(withLastEventUnacknowledged=True,
+                                                                       server=server) if t.last_event]
+
+            results, errors = self._call_servers(get_unacknowledged)
+            eventids = OrderedDict((server, ids) for server, ids in results if ids)
 
             if not eventids:
                 raise CommandError('No unacknowledged events found')
@@ -543,28 +999,31 @@ attached to each event ID. Alerts can be optionally filtered by host or group na
             if eventids_or_note:
                 note = ' '.join(eventids_or_note)
         else:
-            try:
-                eventids = [int(eventid)]
-            except ValueError:
-                raise CommandError('Invalid parameter: **event ID**. Integer required!')
+            _eventids = [eventid]
 
             for i, arg in enumerate(eventids_or_note):
                 try:
-                    eid = int(arg)
-                except ValueError:
+                    self._parse_server_id(arg, 'event ID')
+                except CommandError:
                     note = ' '.join(eventids_or_note[i:])
                     break
                 else:
-                    eventids.append(eid)
+                    _eventids.append(arg)
+
+            eventids = self._group_server_ids(_eventids, 'event ID')
 
         message = '%s: %s' % (self.xmpp.get_jid(msg), note)
 
-        res = self.zapi('event.acknowledge', {
-            'eventids': eventids,
-            'message': message,
-        })
+        def acknowledge(server):
+            return self.zapi('event.acknowledge', {
+                'eventids': eventids[server],
+                'message': message,
+            }, server=server)
+
+        results, _errors = self._call_servers(acknowledge, servers=list(eventids.keys()))
+        acked = [self._server_id(server, i) for server, res in results for i in res.get('eventids', ())]
 
-        return 'Event ID(s) **%s** acknowledged' % ','.join(map(str, res.get('eventids', ())))
+        return '\n'.join(['Event ID(s) **%s** acknowledged' % ','.join(map(str, acked))] + errors + _errors)
 
     # noinspection PyUnusedLocal
     def _outage_del(self, msg, *mids):
@@ -573,14 +1032,12 @@ attached to each event ID. Alerts can be optionally filtered by host or group na
 
         Usage: outage del <maintenance ID1> [maintenance ID2] [maintenance ID3] ...
         """
-        try:
-            mids = [int(i) for i in mids]
-        except ValueError:
-            raise CommandError('Invalid parameter: **maintenance ID**. Integer required!')
-
-        self.zapi('maintenance.delete', mids)
+        mids = self._group_server_ids(mids, 'maintenance ID')
+        results, errors = self._call_servers(lambda server: self.zapi('maintenance.delete', mids[server],
+                                                                      server=server), servers=list(mids.keys()))
+        deleted = [self._server_id(server, i) for server, res in results for i in mids[server]]
 
-        return 'Maintenance ID(s) **%s** deleted' % ','.join(map(str, mids))
+        return '\n'.join(['Maintenance ID(s) **%s** deleted' % ','.join(map(str, deleted))] + errors)
 
     def _maintenance_add(self, jid, since, till, *hosts_or_groups):
         """Create maintenance period in zabbix"""
@@ -588,40 +1045,49 @@ attached to each event ID. Alerts can be optionally filtered by host or group na
         since = since.strftime('%s')
         till = till.strftime('%s')
 
-        options = {
-            'active_since': since,
-            'active_till': till,
-            'maintenance_type': 0,  # with data collection
-            'timeperiods': [{
-                'timeperiod_type': 0,  # one time only
-                'start_date': since,
-                'period': period.seconds,
-            }],
-        }
+        def add(server):
+            options = {
+                'active_since': since,
+                'active_till': till,
+                'maintenance_type': 0,  # with data collection
+                'timeperiods': [{
+                    'timeperiod_type': 0,  # one time only
+                    'start_date': since,
+                    'period': period.seconds,
+                }],
+            }
+
+            # Get hosts
+            hosts = self._search_hosts(*hosts_or_groups, server=server)
 
-        # Get hosts
-        hosts = self._search_hosts(*hosts_or_groups)
+            if hosts:
+                options['hostids'] = list(hosts.keys())
+                desc = 'hosts: ' + ', '.join(hosts.values())
+            else:
+                # Get groups
+                groups = self._search_groups(*hosts_or_groups, server=server)
 
-        if hosts:
-            options['hostids'] = list(hosts.keys())
-            desc = 'hosts: ' + ', '.join(hosts.values())
-        else:
-            # Get groups
-            groups = self._search_groups(*hosts_or_groups)
+                if groups:
+                    options['groupids'] = list(groups.keys())
+                    desc = 'groups: ' + ', '.join(groups.values())
+                else:
+                    return None
 
-            if groups:
-                options['groupids'] = list(groups.keys())
-                desc = 'groups: ' + ', '.join(groups.values())
-            else:
-                raise CommandError('Invalid parameter: **host/group**. Existing host/group required!')
+            options['name'] = ('Maintenance %s by %s' % (since, jid))[:128]
+            options['description'] = desc
+
+            # Create maintenance period
+            res = self.zapi('maintenance.create', options, server=server)
+
+            return 'Added maintenance ID **%s** for %s' % (self._server_id(server, res['maintenanceids'][0]), desc)
 
-        options['name'] = ('Maintenance %s by %s' % (since, jid))[:128]
-        options['description'] = desc
+        results, errors = self._call_servers(add)
+        out = [res for server, res in results if res is not None]
 
-        # Create maintenance period
-        res = self.zapi('maintenance.create', options)
+        if not (out or errors):
+            raise CommandError('Invalid parameter: **host/group**. Existing host/group required!')
 
-        return 'Added maintenance ID **%s** for %s' % (res['maintenanceids'][0], desc)
+        return '\n'.join(out + errors)
 
     def _outage_add(self, msg, start, end_or_duration, *hosts_or_groups):
         """
@@ -635,6 +1101,14 @@ attached to each event ID. Alerts can be optionally filtered by host or group na
 
         return self._maintenance_add(self.xmpp.get_jid(msg), dt_start, dt_end, *hosts_or_groups)
 
+    def _get_maintenances(self, server):
+        """Return list of maintenance periods from one zabbix server"""
+        return self.zapi('maintenance.get', {
+            'output': 'extend',
+            'sortfield': ['maintenanceid', 'name'],
+            'sortorder': 'ASC',
+        }, server=server)
+
     # noinspection PyUnusedLocal
     def _outage_list(self, msg):
         """
@@ -644,13 +1118,10 @@ attached to each event ID. Alerts can be optionally filtered by host or group na
         """
         out = []
         # Display list of maintenances
-        maintenances = self.zapi('maintenance.get', {
-            'output': 'extend',
-            'sortfield': ['maintenanceid', 'name'],
-            'sortorder': 'ASC',
-        })
+        results, errors = self._call_servers(self._get_maintenances)
+        maintenances = [(server, i) for server, res in results for i in res]
 
-        for i in maintenances:
+        for server, i in maintenances:
             if i['description']:
                 desc = '\n\t^^%s^^' % i['description']
             else:
@@ -658,12 +1129,15 @@ attached to each event ID. Alerts can be optionally filtered by host or group na
 
             since = self._zapi.timestamp_to_datetime(i['active_since'])
             until = self._zapi.timestamp_to_datetime(i['active_till'])
-            out.append('**%s**\t%s - %s\t__%s__%s\n' % (i['maintenanceid'], since, until, i['name'], desc))
+            out.append('**%s**\t%s - %s\t__%s__%s\n' % (self._server_id(server, i['maintenanceid']), since, until,
+                                                        i['name'], desc))
 
-        out.append('\n**%d** maintenances are shown.\n%s' % (len(maintenances), self._get_web_link('maintenance')))
+        out.append('\n**%d** maintenances are shown.\n%s' % (len(maintenances), self._get_web_links('maintenance')))
+        out.extend(errors)
 
         return '\n'.join(out)
 
+    @with_deadline
     @command
     def outage(self, msg, *args):
         """
@@ -703,16 +1177,9 @@ attached to each event ID. Alerts can be optionally filtered by host or group na
 
         return self._outage_list(msg)
 
-    @cronjob(minute=range(0, 60, 5))
-    def maintenance(self):
-        """
-        Cron job for cleaning outdated outages and informing about incoming outage end.
-        """
-        maintenances = self.zapi('maintenance.get', {
-            'output': 'extend',
-            'sortfield': ['maintenanceid', 'name'],
-            'sortorder': 'ASC',
-        })
+    def _maintenance_cleanup(self, server):
+        """Clean outdated outages and inform about incoming outage end on one zabbix server"""
+        maintenances = self._get_maintenances(server)
         now = datetime.now()
         in5 = now + timedelta(minutes=5)
 
@@ -724,11 +1191,11 @@ attached to each event ID. Alerts can be optionally filtered by host or group na
 
             if until < now:
                 logger.info('Deleting maintenance %s (%s)', mid, name)
-                self.zapi('maintenance.delete', [mid])
-                msg = 'Maintenance ID **%s** ^^(%s)^^ deleted' % (mid, desc)
+                self.zapi('maintenance.delete', [mid], server=server)
+                msg = 'Maintenance ID **%s** ^^(%s)^^ deleted' % (self._server_id(server, mid), desc)
             elif until < in5:
                 logger.info('Sending notification about maintenance %s (%s) end', mid, name)
-                msg = 'Maintenance ID **%s** ^^(%s)^^ is going to end %s' % (mid, desc,
+                msg = 'Maintenance ID **%s** ^^(%s)^^ is going to end %s' % (self._server_id(server, mid), desc,
                                                                              until.strftime('on %Y-%m-%d at %H:%M:%S'))
             else:
                 continue
@@ -741,67 +1208,90 @@ attached to each event ID. Alerts can be optionally filtered by host or group na
                 logging.warning('Missing JID in maintenance %s (%s). Broadcasting to all users..."', mid, name)
                 self.xmpp.msg_broadcast(msg)
 
+    @cronjob(minute=range(0, 60, 5))
+    def maintenance(self):
+        """
+        Cron job for cleaning outdated outages and informing about incoming outage end.
+        """
+        self._call_servers(self._maintenance_cleanup)
+
     # noinspection PyUnusedLocal
+    @with_deadline
     @command
     def hosts(self, msg, hoststr=None):
         """
-        Show a list of hosts.
+        Show a list of hosts. Hosts can be also searched by interface (ip, dns) or inventory fields \
+(e.g. os:freebsd ip:10.1.*) in a local host index.
 
-        Usage: hosts [host name search string]
+        Usage: hosts [host name search string] [field:value ...]
         """
         out = []
-        params = {
-            'output': ['hostid', 'name', 'available', 'maintenance_status', 'status'],
-            'selectInventory': 1,  # All inventory items
-            'sortfield': ['name', 'hostid'],
-            'sortorder': 'ASC',
-            'searchWildcardsEnabled': True,
-            'searchByAny': True,
-        }
-
-        if hoststr:
-            params['search'] = {'name': hoststr}
 
-        # Get hosts
-        hosts = self.zapi('host.get', params)
+        if hoststr and ':' in hoststr:
+            hosts, errors, fetched = self._search_host_index(hoststr)
 
-        for host in hosts:
-            if int(host['maintenance_status']):
-                host['name'] += ' **++**'  # some kind of maintenance
-
-            if int(host['status']):
+            if fetched is None:
+                footer = ''
+            else:  # The index is refreshed gradually -> show age of the oldest shown host data
+                footer = '^^(host data from the host index, fetched up to %s ago)^^\n' % self._zapi.get_age(
+                    datetime.fromtimestamp(fetched))
+        else:
+            params = {
+                'output': list(self.HOST_OUTPUT),
+                'selectInventory': 1,  # All inventory items
+                'sortfield': ['name', 'hostid'],
+                'sortorder': 'ASC',
+                'searchWildcardsEnabled': True,
+                'searchByAny': True,
+            }
+
+            if hoststr:
+                params['search'] = {'name': hoststr}
+
+            # Get hosts
+            results, errors = self._call_servers(lambda server: self.zapi('host.get', params, server=server,
+                                                                          record=Host))
+            hosts = [(server, host) for server, res in results for host in res]
+            footer = ''
+
+            if len(results) > 1:
+                hosts.sort(key=lambda x: x[1].name)
+
+        for server, host in hosts:
+            name = host.name
+            if host.maintenance_status:
+                name += ' **++**'  # some kind of maintenance
+
+            if host.status:
                 status = 'Not monitored'
             else:
                 status = 'Monitored'
 
-            ae = int(host['available'])
+            ae = host.available
             available = 'Z'
             if ae == 1:
                 available = green('Z')
             elif ae == 2:
                 available = red('Z')
 
-            latest_data = '[[%s|Latest data]]' % self._get_web_link('latest_data', hostid=host['hostid'])
-
-            _inventory = []
-            if host['inventory']:
-                for key, val in host['inventory'].items():
-                    if val and key not in ('inventory_mode', 'hostid'):
-                        _inventory.append('**%s**: %s' % (key, val))
+            latest_data = '[[%s|Latest data]]' % self._get_web_link('latest_data', server=server, hostid=host.hostid)
+            _inventory = ['**%s**: %s' % (key, val) for key, val in host.inventory]
 
             if _inventory:
                 inventory = '\n\t\t^^%s^^' % str(', '.join(_inventory)).strip()
             else:
                 inventory = ''
 
-            out.append('**%s**\t%s\t%s\t%s\t%s%s' % (host['hostid'], host['name'], status,
+            out.append('**%s**\t%s\t%s\t%s\t%s%s' % (self._server_id(server, host.hostid), name, status,
                                                      available, latest_data, inventory))
 
-        out.append('\n**%d** hosts are shown.\n%s' % (len(hosts), self._get_web_link('hosts')))
+        out.append('\n**%d** hosts are shown.\n%s%s' % (len(hosts), footer, self._get_web_links('hosts')))
+        out.extend(errors)
 
         return '\n'.join(out)
 
     # noinspection PyUnusedLocal
+    @with_deadline
     @command
     def groups(self, msg, groupstr=None):
         """
@@ -823,13 +1313,380 @@ attached to each event ID. Alerts can be optionally filtered by host or group na
             params['search'] = {'name': groupstr}
 
         # Get groups
-        groups = self.zapi('hostgroup.get', params)
+        results, errors = self._call_servers(lambda server: self.zapi('hostgroup.get', params, server=server))
+        groups = [(server, group) for server, res in results for group in res]
 
-        for group in groups:
-            _hosts = ['**%s**: %s' % (h['hostid'], h['name']) for h in group['hosts'] if h]
+        if len(results) > 1:
+            groups.sort(key=lambda x: x[1]['name'])
+
+        for server, group in groups:
+            _hosts = ['**%s**: %s' % (self._server_id(server, h['hostid']), h['name']) for h in group['hosts'] if h]
             hosts = '\n\t\t^^%s ^^' % ', '.join(_hosts)
-            out.append('**%s**\t%s%s' % (group['groupid'], group['name'], hosts))
+            out.append('**%s**\t%s%s' % (self._server_id(server, group['groupid']), group['name'], hosts))
+
+        out.append('\n**%d** hostgroups are shown.\n%s' % (len(groups), self._get_web_links('hostgroups')))
+        out.extend(errors)
+
+        return '\n'.join(out)
+
+    def _fold_history(self, server, item, samples):
+        """Fetch item history in chunks ordered by clock and fold them into samples"""
+        params = {
+            'output': ['clock', 'value'],
+            'history': int(item['value_type']),
+            'itemids': [item['itemid']],
+            'time_from': samples.since,
+            'time_till': samples.until,
+            'sortfield': 'clock',
+            'sortorder': 'ASC',
+            'limit': self.HISTORY_CHUNK,
+        }
+
+        while True:
+            rows = self.zapi('history.get', params, server=server, cache=False)
+
+            if len(rows) < self.HISTORY_CHUNK:
+                samples.add_history(rows)
+                break
+
+            # The next chunk starts at the last clock, because there may be more values with the same clock
+            last_clock = int(rows[-1]['clock'])
+            i = len(rows)
+
+            while i and int(rows[i - 1]['clock']) == last_clock:
+                i -= 1
+
+            if i:
+                samples.add_history(rows[:i])
+                params['time_from'] = last_clock
+            else:  # All values have the same clock
+                samples.add_history(rows)
+                params['time_from'] = last_clock + 1
+
+    def _fold_trends(self, server, item, samples):
+        """Fetch hourly item trends in time windows and fold them into samples"""
+        window = self.HISTORY_CHUNK * 3600
+
+        for time_from in range(samples.since, samples.until, window):
+            samples.add_trends(self.zapi('trends.get', {
+                'output': ['clock', 'num', 'value_min', 'value_avg', 'value_max'],
+                'itemids': [item['itemid']],
+                'time_from': time_from,
+                'time_till': min(time_from + window - 1, samples.until),
+            }, server=server, cache=False))
+
+    def _get_history(self, server, host, item_key, since, until, trends=False):
+        """Return list of (host name, item, Downsampler) tuples for at most HISTORY_MAX_ITEMS numeric items matching
+        host and item key search strings, a partial results flag (command deadline exceeded) and a flag indicating
+        that more items match. Return None if no matching host exists on the server"""
+        hosts = self._search_hosts(host, server=server)
+
+        if not hosts:
+            return None
+
+        items = self.zapi('item.get', {
+            'output': ['itemid', 'hostid', 'name', 'key_', 'value_type', 'units'],
+            'hostids': list(hosts.keys()),
+            'search': {'key_': item_key},
+            'searchWildcardsEnabled': True,
+            'filter': {'value_type': self.NUMERIC_VALUE_TYPES},
+            'sortfield': 'name',
+            'limit': self.HISTORY_MAX_ITEMS + 1,  # Detect hidden items
+        }, server=server)
+        more = len(items) > self.HISTORY_MAX_ITEMS
+        res = []
+
+        for item in items[:self.HISTORY_MAX_ITEMS]:
+            samples = Downsampler(since, until, buckets=self.HISTORY_BUCKETS)
+            res.append((hosts[item['hostid']], item, samples))
+
+            try:
+                if trends:
+                    self._fold_trends(server, item, samples)
+                else:
+                    self._fold_history(server, item, samples)
+            except DeadlineExceeded:  # Show already folded values
+                return res, True, more
+
+        return res, False, more
+
+    # noinspection PyUnusedLocal
+    @with_deadline
+    @command
+    def history(self, msg, host, item, duration='-1h'):
+        """
+        Show a graph and statistics of numeric item values over a time period (default: last hour). \
+Values older than 2 days are taken from trends.
+
+        Usage: history <host name> <item key search string> [-duration{s|m|h|d}]
+        """
+        if not duration.startswith('-'):
+            raise CommandError('Invalid parameter: **duration**. Duration required! (format: -<duration{s|m|h|d}>)')
+
+        _zapi = self._zapi
+        dt_until = datetime.now()
+        dt_since = self._parse_datime_or_duration(duration[1:], 'duration', end_time=dt_until)
+        since = int(dt_since.strftime('%s'))
+        until = int(dt_until.strftime('%s'))
+        trends = (until - since) > self.HISTORY_TRENDS_PERIOD
+        out = []
+
+        results, errors = self._call_servers(lambda server: self._get_history(server, host, item, since, until,
+                                                                              trends=trends))
+        results = [(server, res) for server, res in results if res is not None]
+
+        if not (results or errors):
+            raise CommandError('Invalid parameter: **host**. Existing host required!')
+
+        items = [(server, i) for server, res in results for i in res[0]]
+
+        for server, (hostname, i, samples) in items:
+            stats = samples.stats()
+            link = '[[%s|History]]' % self._get_web_link('history', server=server, itemid=i['itemid'])
+
+            if stats:
+                units = i['units']
+                graph = '\n\t%s\n\t^^min: %s, avg: %s, max: %s, last: %s (%d values)^^' % (
+                    samples.sparkline(), format_value(stats[0], units), format_value(stats[1], units),
+                    format_value(stats[2], units), format_value(samples.last_value, units), samples.total)
+            else:
+                graph = '\n\t^^(no data)^^'
+
+            out.append('**%s**: %s ^^(%s)^^%s\n\t%s\n' % (hostname, i['name'], i['key_'], graph, link))
+
+        out.append('\n**%d** items are shown.' % len(items))
+
+        if any(res[2] for server, res in results):
+            out.append('(more items are hidden - at most %d items%s are shown)' %
+                       (self.HISTORY_MAX_ITEMS, ' per server' if len(self._zapis) > 1 else ''))
+
+        out.append('Time period: %s - %s (%s)' % (_zapi.convert_datetime(dt_since), _zapi.convert_datetime(dt_until),
+                                                  'trends' if trends else 'history'))
+
+        if any(res[1] for server, res in results):
+            out.append('**Partial results**: some values are missing (command deadline exceeded)')
+
+        out.extend(errors)
+
+        return '\n'.join(out)
+
+    def _get_latest(self, server, host_or_group, item_key):
+        """Return list of (host name, item) tuples with last values of items matching the item key search string on
+        hosts matching the host or group search string and a partial results flag (command deadline exceeded).
+        Return None if no matching host or group exists"""
+        hosts = self._search_hosts(host_or_group, server=server)
+
+        if not hosts:
+            groups = self._search_groups(host_or_group, server=server)
+
+            if not groups:
+                return None
+
+            hosts = dict((h['hostid'], h['name']) for h in self.zapi('host.get', {
+                'output': ['hostid', 'name'],
+                'groupids': list(groups.keys()),
+            }, server=server))
+
+        hostids = list(hosts.keys())
+        params = {
+            'output': ['itemid', 'hostid', 'name', 'key_', 'value_type', 'units', 'lastvalue', 'lastclock'],
+            'search': {'key_': item_key},
+            'searchWildcardsEnabled': True,
+            'monitored': True,
+        }
+        res = []
+
+        for i in range(0, len(hostids), self.LATEST_PAGE_SIZE):
+            params['hostids'] = hostids[i:i + self.LATEST_PAGE_SIZE]
+
+            try:
+                items = self.zapi('item.get', params, server=server, cache=False)
+            except DeadlineExceeded:  # Show items from already fetched pages
+                return res, True
+
+            res.extend((hosts[item['hostid']], item) for item in items)
+
+        return res, False
+
+    # noinspection PyUnusedLocal
+    @with_deadline
+    @command
+    def latest(self, msg, host_or_group, item):
+        """
+        Show last values of items on all matching hosts sorted by value.
+
+        Usage: latest <host/group name search string> <item key search string>
+        """
+        _zapi = self._zapi
+        out = []
+        results, errors = self._call_servers(lambda server: self._get_latest(server, host_or_group, item))
+        results = [(server, res) for server, res in results if res is not None]
+
+        if not (results or errors):
+            raise CommandError('Invalid parameter: **host/group**. Existing host/group required!')
+
+        rows = []
+
+        for server, res in results:
+            for hostname, i in res[0]:
+                if not int(i['lastclock']):  # No data yet
+                    rows.append(((2, 0), '-', '^^(no data)^^', hostname, i))
+                elif int(i['value_type']) in self.NUMERIC_VALUE_TYPES:
+                    value = float(i['lastvalue'])
+                    age = '^^%s^^' % _zapi.get_age(_zapi.get_datetime(i['lastclock']))
+                    rows.append(((0, -value), format_value(value, i['units']), age, hostname, i))
+                else:
+                    age = '^^%s^^' % _zapi.get_age(_zapi.get_datetime(i['lastclock']))
+                    rows.append(((1, i['lastvalue']), i['lastvalue'], age, hostname, i))
+
+        rows.sort(key=lambda x: x[0])
+
+        for key, value, age, hostname, i in rows[:self.LATEST_MAX_ROWS]:
+            out.append('**%s**\t%s\t%s ^^(%s)^^\t%s' % (value, hostname, i['name'], i['key_'], age))
+
+        out.append('\n**%d** items are shown.' % min(len(rows), self.LATEST_MAX_ROWS))
+
+        if len(rows) > self.LATEST_MAX_ROWS:
+            out.append('(%d items are hidden)' % (len(rows) - self.LATEST_MAX_ROWS))
+
+        if any(res[1] for server, res in results):
+            out.append('**Partial results**: some items are missing (command deadline exceeded)')
+
+        out.extend(errors)
+
+        return '\n'.join(out)
+
+    def _get_problem_stats(self, server, since, until):
+        """Fetch trigger events in chunks ordered by event ID and fold them into problem statistics. Return
+        the statistics and a partial results flag (command deadline exceeded)"""
+        stats = ProblemStats(since, until)
+        params = {
+            'output': ['eventid', 'objectid', 'clock', 'value'],
+            'source': 0,  # Triggers
+            'object': 0,  # Triggers
+            'time_from': since,
+            'time_till': until,
+            'sortfield': ['eventid'],
+            'sortorder': 'ASC',
+            'limit': self.TOP_PAGE_SIZE,
+        }
+
+        while True:
+            try:
+                events = self.zapi('event.get', params, server=server, cache=False, record=Event)
+            except DeadlineExceeded:  # Use already fetched events
+                return stats, True
+
+            stats.add_events(events)
+
+            if len(events) < self.TOP_PAGE_SIZE:
+                return stats, False
+
+            params['eventid_from'] = events[-1].eventid + 1
+
+    def _get_top(self, server, what, since, until, limit):
+        """Return list of (key, server, ID, host name or trigger) tuples with the most problematic hosts or triggers
+        and a partial results flag (command deadline exceeded)"""
+        deadline = Deadline.current()
+
+        # Leave some time for fetching trigger and host names if all events cannot be fetched before the deadline
+        with activate(Deadline(deadline.remaining() * self.TOP_EVENTS_BUDGET) if deadline else None):
+            stats, partial = self._get_problem_stats(server, since, until)
+
+        totals = stats.totals()
+
+        if what == 'triggers':
+            top = ProblemStats.top(totals, limit)
+            triggers = {}
+
+            try:
+                if top:
+                    triggers.update((t.triggerid, t) for t in self.zapi('trigger.get', {
+                        'output': ['triggerid', 'description', 'priority'],
+                        'triggerids': [triggerid for triggerid, key in top],
+                        'expandDescription': True,
+                        'selectHosts': ['hostid', 'name'],
+                    }, server=server, record=Trigger))
+            except DeadlineExceeded:
+                partial = True
+
+            return [(key, server, triggerid, triggers.get(triggerid, None)) for triggerid, key in top], partial
+
+        # Sum trigger statistics by host
+        hosts = {}
+        names = {}
+        triggerids = list(totals.keys())
+
+        try:
+            for i in range(0, len(triggerids), self.TOP_TRIGGERS_CHUNK):
+                for trigger in self.zapi('trigger.get', {
+                    'output': ['triggerid'],
+                    'triggerids': triggerids[i:i + self.TOP_TRIGGERS_CHUNK],
+                    'selectHosts': ['hostid', 'name'],
+                }, server=server, cache=False, record=Trigger):
+                    problems, duration = totals[trigger.triggerid]
+
+                    for host in trigger.hosts:
+                        host_problems, host_duration = hosts.get(host.hostid, (0, 0))
+                        hosts[host.hostid] = (host_problems + problems, host_duration + duration)
+                        names[host.hostid] = host.name
+        except DeadlineExceeded:  # Use already summed hosts
+            partial = True
+
+        return [(key, server, hostid, names[hostid]) for hostid, key in ProblemStats.top(hosts, limit)], partial
+
+    # noinspection PyUnusedLocal
+    @with_deadline
+    @command
+    def top(self, msg, *args):
+        """
+        Show hosts or triggers with the highest number of problems over a time period (default: triggers, last 7 days, \
+top 10).
+
+        Usage: top [hosts|triggers] [-duration{s|m|h|d}] [N]
+        """
+        what = 'triggers'
+        duration = '-7d'
+        limit = self.TOP_DEFAULT
+
+        for arg in args:
+            if arg in ('hosts', 'triggers'):
+                what = arg
+            elif arg.startswith('-'):
+                duration = arg
+            else:
+                try:
+                    limit = min(max(int(arg), 1), self.TOP_MAX)
+                except ValueError:
+                    raise CommandError('Invalid parameter: **N**. Integer required!')
+
+        _zapi = self._zapi
+        dt_until = datetime.now()
+        dt_since = self._parse_datime_or_duration(duration[1:], 'duration', end_time=dt_until)
+        since = int(dt_since.strftime('%s'))
+        until = int(dt_until.strftime('%s'))
+        out = []
+
+        results, errors = self._call_servers(lambda server: self._get_top(server, what, since, until, limit))
+        rows = heapq.nlargest(limit, (row for server, res in results for row in res[0]), key=lambda x: x[0])
+
+        for rank, ((problems, problem_time), server, objid, obj) in enumerate(rows, start=1):
+            if what == 'hosts':
+                name = '**%s**: %s' % (self._server_id(server, objid), obj)
+            elif obj:
+                name = '%s\t%s\t%s' % (_zapi.get_severity(obj.priority).ljust(12),
+                                       ', '.join(h.name for h in obj.hosts), obj.description)
+            else:
+                name = '**%s**: ^^(unknown trigger)^^' % self._server_id(server, objid)
+
+            out.append('%d.\t**%d**\t^^%s^^\t%s' % (rank, problems, format_duration(problem_time), name))
+
+        out.append('\n**%d** %s are shown (number of problems, total problem duration).' % (len(rows), what))
+        out.append('Time period: %s - %s' % (_zapi.convert_datetime(dt_since), _zapi.convert_datetime(dt_until)))
+
+        if any(res[1] for server, res in results):
+            out.append('**Partial results**: some events are not counted (command deadline exceeded)')
 
-        out.append('\n**%d** hostgroups are shown.\n%s' % (len(groups), self._get_web_link('hostgroups')))
+        out.extend(errors)
 
         return '\n'.join(out)
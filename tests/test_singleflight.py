@@ -0,0 +1,144 @@
+"""
+This file is part of Ludolph: Zabbix API plugin
+Copyright (C) 2015-2017 Erigones, s. r. o.
+
+See the LICENSE file for copying permission.
+"""
+import time
+import unittest
+from threading import Event, Thread
+
+from ludolph_zabbix.deadline import Deadline, DeadlineExceeded, activate
+from ludolph_zabbix.singleflight import SingleFlight
+
+
+class SingleFlightTest(unittest.TestCase):
+    KEY = ('zabbix', 'host.get', None, '{}')
+
+    def _run(self, fun, deadline=None):
+        """Run SingleFlight.do() in a thread; return the thread and dict with its result or exception"""
+        res = {}
+
+        def run():
+            with activate(deadline):
+                try:
+                    res['result'] = self.single_flight.do(self.KEY, fun, retry_on=(DeadlineExceeded,))
+                except Exception as exc:
+                    res['exception'] = exc
+
+        thread = Thread(target=run)
+        thread.start()
+
+        return thread, res
+
+    def _wait_for_leader(self):
+        for _ in range(500):
+            if self.KEY in self.single_flight._calls:
+                return
+            time.sleep(0.01)
+
+        self.fail('The leader call has not started')
+
+    def _wait_for_follower(self):
+        call = self.single_flight._calls[self.KEY]
+
+        for _ in range(500):
+            if call.followers:
+                return  # The follower will get the result of the leader call even if it has not started waiting yet
+            time.sleep(0.01)
+
+        self.fail('The follower has not joined the leader call')
+
+    def setUp(self):
+        self.single_flight = SingleFlight()
+
+    def test_shared_result(self):
+        release = Event()
+        calls = []
+
+        def fun():
+            calls.append(1)
+            release.wait(5)
+            return 'hosts'
+
+        leader, leader_res = self._run(fun)
+        self._wait_for_leader()
+        follower, follower_res = self._run(fun)
+        self._wait_for_follower()
+        release.set()
+        leader.join()
+        follower.join()
+
+        self.assertEqual(leader_res, {'result': 'hosts'})
+        self.assertEqual(follower_res, {'result': 'hosts'})
+        self.assertEqual(len(calls), 1)
+
+    def test_shared_error(self):
+        release = Event()
+
+        def fun():
+            release.wait(5)
+            raise ValueError('API error')
+
+        leader, leader_res = self._run(fun)
+        self._wait_for_leader()
+        follower, follower_res = self._run(fun)
+        self._wait_for_follower()
+        release.set()
+        leader.join()
+        follower.join()
+
+        self.assertIsInstance(leader_res['exception'], ValueError)
+        self.assertIs(follower_res['exception'], leader_res['exception'])
+
+    def test_leader_deadline_not_shared(self):
+        calls = []
+
+        def fun():
+            # Slow API call which is interrupted by the deadline of the caller
+            deadline = Deadline.current()
+            calls.append(deadline)
+            time.sleep(min(deadline.remaining(), 0.3))
+            deadline.check()
+            return 'hosts'
+
+        leader, leader_res = self._run(fun, deadline=Deadline(0.1))
+        self._wait_for_leader()
+        follower, follower_res = self._run(fun, deadline=Deadline(10))
+        leader.join()
+        follower.join()
+
+        self.assertIsInstance(leader_res['exception'], DeadlineExceeded)
+        self.assertEqual(follower_res, {'result': 'hosts'})
+        self.assertEqual(len(calls), 2)
+
+    def test_clear_during_call(self):
+        self.single_flight = SingleFlight(ttl=60)
+        release = Event()
+        calls = []
+
+        def fun():
+            calls.append(1)
+
+            if len(calls) == 1:
+                release.wait(5)
+                return 'old hosts'
+
+            return 'new hosts'
+
+        leader, leader_res = self._run(fun)
+        self._wait_for_leader()
+        self.single_flight.clear()  # Called after a write API call
+        # A call started after clear() does not join the (possibly outdated) call in progress
+        self.assertEqual(self.single_flight.do(self.KEY, fun), 'new hosts')
+        release.set()
+        leader.join()
+
+        self.assertEqual(leader_res, {'result': 'old hosts'})
+        # The outdated result is not cached and does not replace the new one
+        self.assertEqual(self.single_flight.do(self.KEY, fun), 'new hosts')
+        self.assertEqual(len(calls), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,238 @@
+"""
+This file is part of Ludolph: Zabbix API plugin
+Copyright (C) 2015-2017 Erigones, s. r. o.
+
+See the LICENSE file for copying permission.
+"""
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from threading import Lock, Thread
+
+from ludolph_zabbix.spool import AlertSpool, SpoolFull
+
+
+def _line(i):
+    return (json.dumps({'i': i}, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+class AlertSpoolTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'alerts.spool')
+        self.spools = []
+        self.delivered = []
+        self.lock = Lock()
+
+    def tearDown(self):
+        for spool in self.spools:
+            spool.stop()
+
+        shutil.rmtree(self.tmpdir)
+
+    def _spool(self, **kwargs):
+        spool = AlertSpool(self.path, **kwargs)
+        spool.RETRY_INTERVAL = 0.01
+        self.spools.append(spool)
+
+        return spool
+
+    def _deliver(self, record):
+        with self.lock:
+            self.delivered.append(record['i'])
+
+    def _start(self, spool, deliver=None, is_ready=lambda: True):
+        spool.start(deliver or self._deliver, is_ready)
+
+    def _stop(self, spool):
+        spool.stop()
+        self.spools.remove(spool)
+
+    def _wait_for(self, cond, timeout=10):
+        expires = time.time() + timeout
+
+        while not cond():
+            if time.time() > expires:
+                self.fail('Timeout while waiting for spool delivery')
+            time.sleep(0.01)
+
+    def _write(self, data, offset=None):
+        with open(self.path, 'wb') as fp:
+            fp.write(data)
+
+        if offset is not None:
+            with open(self.path + '.offset', 'w') as fp:
+                fp.write(str(offset))
+
+    def _read(self):
+        with open(self.path, 'rb') as fp:
+            return fp.read()
+
+    def test_deliver_and_compact(self):
+        spool = self._spool(fsync_interval=0)
+        self._start(spool)
+
+        for i in range(10):
+            spool.append({'i': i})
+
+        self._wait_for(lambda: not spool.pending and not spool._size)
+        self.assertEqual(self.delivered, list(range(10)))
+        self.assertEqual(self._read(), b'')
+
+    def test_torn_record_removed(self):
+        self._write(_line(0) + _line(1) + b'{"i":')
+        spool = self._spool()
+        spool._open()
+
+        self.assertEqual(self._read(), _line(0) + _line(1))
+        self.assertEqual(spool.pending, len(_line(0) + _line(1)))
+
+    def test_torn_record_not_delivered(self):
+        self._write(_line(0) + b'{"i":', offset=0)
+        spool = self._spool()
+        self._start(spool)
+        spool.append({'i': 1})
+
+        self._wait_for(lambda: len(self.delivered) == 2)
+        self.assertEqual(self.delivered, [0, 1])
+
+    def test_invalid_offset(self):
+        data = _line(0) + _line(1) + _line(2)
+
+        for offset in ('garbage', len(data) + 1, -1):
+            self._write(data, offset=offset)
+            spool = self._spool()
+            spool._open()
+            self.assertEqual(spool.pending, len(data), 'offset %r' % (offset,))
+
+    def test_invalid_offset_redelivery(self):
+        self._write(_line(0) + _line(1), offset='garbage')
+        spool = self._spool()
+        self._start(spool)
+
+        self._wait_for(lambda: len(self.delivered) == 2)
+        self.assertEqual(self.delivered, [0, 1])
+
+    def test_compact_with_concurrent_append(self):
+        spool = self._spool(fsync_interval=0)
+        spool._open()
+
+        for i in range(10):
+            spool.append({'i': i})
+
+        copy = spool._copy
+        copies = []
+
+        def copy_and_append(src, dst, start, end):
+            copy(src, dst, start, end)
+
+            if not copies:  # The first copy is done without holding the lock
+                spool.append({'i': 10})
+            copies.append((start, end))
+
+        spool._copy = copy_and_append
+        spool._save_offset(len(_line(0)) * 4)
+        spool._compact()
+
+        self.assertEqual(len(copies), 2)
+        self.assertEqual(self._read(), b''.join(_line(i) for i in range(4, 11)))
+        self.assertEqual(spool._size, os.path.getsize(self.path))
+        self.assertEqual(spool.pending, spool._size)
+
+        with open(spool.offset_path) as fp:
+            self.assertEqual(fp.read(), '0')
+
+        spool.append({'i': 11})  # The new file is used for appending
+        self.assertEqual(self._read(), b''.join(_line(i) for i in range(4, 12)))
+
+    def test_delivery_with_concurrent_append(self):
+        count = 5000
+        spool = self._spool(max_size=8192)
+        spool.BATCH_SIZE = 50
+        self._start(spool)
+
+        def append():
+            i = 0
+
+            while i < count:
+                try:
+                    spool.append({'i': i})
+                except SpoolFull:
+                    time.sleep(0.001)
+                else:
+                    i += 1
+
+        appender = Thread(target=append)
+        appender.start()
+        appender.join()
+
+        self._wait_for(lambda: len(self.delivered) == count)
+        self.assertEqual(self.delivered, list(range(count)))
+
+    def test_crash_before_rename(self):
+        # State after a crash between saving the reset offset and renaming the compacted file
+        self._write(_line(0) + _line(1) + _line(2), offset=0)
+        with open(self.path + '.tmp', 'wb') as fp:
+            fp.write(_line(1))
+
+        spool = self._spool()
+        self._start(spool)
+
+        # Delivered records are repeated, but no record is lost
+        self._wait_for(lambda: len(self.delivered) == 3)
+        self.assertEqual(self.delivered, [0, 1, 2])
+
+    def test_redelivery_after_restart(self):
+        spool = self._spool()
+        self._start(spool, is_ready=lambda: False)
+
+        for i in range(5):
+            spool.append({'i': i})
+
+        self._stop(spool)
+        self.assertEqual(self.delivered, [])
+
+        spool = self._spool()
+        self._start(spool)
+
+        self._wait_for(lambda: len(self.delivered) == 5)
+        self.assertEqual(self.delivered, list(range(5)))
+
+    def test_redelivery_after_failure(self):
+        def deliver(record):
+            if record['i'] == 2:
+                raise RuntimeError('XMPP connection lost')
+            self._deliver(record)
+
+        spool = self._spool()
+        self._start(spool, deliver=deliver)
+
+        for i in range(5):
+            spool.append({'i': i})
+
+        self._wait_for(lambda: len(self.delivered) == 2)
+        self._stop(spool)
+        self.assertEqual(self.delivered, [0, 1])
+
+        spool = self._spool()
+        self._start(spool)
+
+        # Only records after the last delivered one are delivered again
+        self._wait_for(lambda: len(self.delivered) == 5)
+        self.assertEqual(self.delivered, list(range(5)))
+
+    def test_spool_full(self):
+        spool = self._spool(max_size=len(_line(0)) * 2)
+        self._start(spool, is_ready=lambda: False)
+        spool.append({'i': 0})
+        spool.append({'i': 1})
+
+        self.assertRaises(SpoolFull, spool.append, {'i': 2})
+        self.assertEqual(spool.pending, len(_line(0)) * 2)
+
+
+if __name__ == '__main__':
+    unittest.main()